@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Profile, Notification, Conversation, Message, UserNote, MessageRequest
+from .models import Profile, Notification, NotificationActor, Conversation, ConversationRead, Message, UserNote, MessageRequest, FollowSuggestion, Follow, UserSearchTerm
 
 
 @admin.register(Profile)
@@ -9,6 +9,28 @@ class ProfileAdmin(admin.ModelAdmin):
     list_filter = ('created_at',)
 
 
+@admin.register(Follow)
+class FollowAdmin(admin.ModelAdmin):
+    list_display = ('follower', 'followed', 'created_at')
+    search_fields = ('follower__user__username', 'followed__user__username')
+    raw_id_fields = ('follower', 'followed')
+
+
+@admin.register(FollowSuggestion)
+class FollowSuggestionAdmin(admin.ModelAdmin):
+    list_display = ('user', 'candidate', 'score', 'updated_at')
+    search_fields = ('user__username', 'candidate__username')
+    raw_id_fields = ('user', 'candidate')
+
+
+@admin.register(UserSearchTerm)
+class UserSearchTermAdmin(admin.ModelAdmin):
+    list_display = ('user', 'term', 'kind')
+    list_filter = ('kind',)
+    search_fields = ('term', 'user__username')
+    raw_id_fields = ('user',)
+
+
 @admin.register(Notification)
 class NotificationAdmin(admin.ModelAdmin):
     list_display = ('recipient', 'actor', 'verb', 'is_read', 'created_at')
@@ -16,12 +38,24 @@ class NotificationAdmin(admin.ModelAdmin):
     search_fields = ('recipient__username', 'actor__username')
 
 
+@admin.register(NotificationActor)
+class NotificationActorAdmin(admin.ModelAdmin):
+    list_display = ('notification', 'actor')
+    raw_id_fields = ('notification', 'actor')
+
+
 @admin.register(Conversation)
 class ConversationAdmin(admin.ModelAdmin):
     list_display = ('id', 'created_at', 'updated_at')
     filter_horizontal = ('participants',)
 
 
+@admin.register(ConversationRead)
+class ConversationReadAdmin(admin.ModelAdmin):
+    list_display = ('user', 'conversation', 'last_read_message_id', 'updated_at')
+    search_fields = ('user__username',)
+
+
 @admin.register(Message)
 class MessageAdmin(admin.ModelAdmin):
     list_display = ('sender', 'conversation', 'text', 'is_read', 'created_at')
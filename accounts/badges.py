@@ -0,0 +1,83 @@
+"""
+Unread badge counters.
+
+Each profile carries unread notification and message counts that move
+with F() updates when notifications are written, messages are sent and
+read marks are set, so ``/api/badges/`` never counts rows. The pair is
+cached per user and invalidated on every change; responses carry an ETag
+so an unchanged badge costs a 304. Once a change commits, the new counts
+are pushed to the user's open tabs over ws/notifications/. The cache is
+the one all workers share (CACHE_REDIS_URL in settings), so a change made
+by one worker is what every other worker serves next.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+
+from . import push
+from .models import Profile
+
+
+CACHE_TIMEOUT = 300
+
+FIELDS = {
+    'notifications': 'unread_notifications_count',
+    'messages': 'unread_messages_count',
+}
+
+
+def cache_key(user_id):
+    return f'badges:{user_id}'
+
+
+def adjust(user_ids, notifications=0, messages=0):
+    """Move the users' unread counters by the given amounts, never below zero"""
+    user_ids = list(user_ids)
+    deltas = {'notifications': notifications, 'messages': messages}
+    changes = {
+        FIELDS[name]: Greatest(F(FIELDS[name]) + delta, 0)
+        for name, delta in deltas.items() if delta
+    }
+    if not user_ids or not changes:
+        return
+    Profile.objects.filter(user_id__in=user_ids).update(**changes)
+    cache.delete_many([cache_key(user_id) for user_id in user_ids])
+    transaction.on_commit(lambda: publish(user_ids))
+
+
+def publish(user_ids):
+    """Push the users' current counts to their open tabs, refreshing the cache on the way"""
+    rows = Profile.objects.filter(user_id__in=user_ids).values(
+        'user_id', notifications=F(FIELDS['notifications']), messages=F(FIELDS['messages'])
+    )
+    for row in rows:
+        user_id = row.pop('user_id')
+        cache.set(cache_key(user_id), row, CACHE_TIMEOUT)
+        push.send(user_id, {'type': 'badges.update', 'badges': row})
+
+
+def add_notifications(counts):
+    """Bump unread notification counts from a {user_id: new unread} mapping"""
+    by_delta = {}
+    for user_id, delta in counts.items():
+        if delta:
+            by_delta.setdefault(delta, []).append(user_id)
+    for delta, user_ids in by_delta.items():
+        adjust(user_ids, notifications=delta)
+
+
+def badges_for(user):
+    """{'notifications': n, 'messages': m} for the user, from cache when possible"""
+    key = cache_key(user.id)
+    badges = cache.get(key)
+    if badges is None:
+        badges = Profile.objects.filter(user=user).values(
+            notifications=F(FIELDS['notifications']), messages=F(FIELDS['messages'])
+        ).first() or {'notifications': 0, 'messages': 0}
+        cache.set(key, badges, CACHE_TIMEOUT)
+    return badges
+
+
+def etag_for(badges):
+    return f'"{badges["notifications"]}-{badges["messages"]}"'
@@ -1,14 +1,36 @@
+import asyncio
 import json
+import time
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from django.contrib.auth.models import User
-from .models import Conversation, Message
+from django.core.cache import cache
+from django.db import transaction
+from . import badges, membership, push, receipts
+from .models import Conversation, Message, Profile
+
+
+# Clients send a typing frame on every keystroke. Typing state lives in the
+# cache under (conversation, user). Workers share that cache (Redis, see
+# CACHE_REDIS_URL in settings), so every tab a user types from shares it,
+# whichever worker holds the connection: "typing" is broadcast at most every
+# TYPING_REFRESH seconds, and "stopped typing" is inferred after TYPING_TTL
+# seconds without a frame from any of them. With the local memory cache of
+# a single-process setup, this only holds within that process.
+TYPING_REFRESH = 2.0
+TYPING_TTL = 5.0
+
+
+def typing_keys(conversation_id, user_id):
+    """Cache keys for (last typing frame, last "typing" broadcast)"""
+    prefix = f'typing:{conversation_id}:{user_id}'
+    return f'{prefix}:seen', f'{prefix}:sent'
 
 
 class ChatConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.conversation_id = self.scope['url_route']['kwargs']['conversation_id']
-        self.room_group_name = f'chat_{self.conversation_id}'
+        self.room_group_name = receipts.group_name(self.conversation_id)
         
         # Check if user is authenticated
         user = self.scope['user']
@@ -16,12 +38,17 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         
-        # Check if user is participant in conversation
-        is_participant = await self.is_user_participant(user, self.conversation_id)
-        if not is_participant:
+        # Check if user is participant in conversation, and keep the sender
+        # details every outgoing message repeats
+        self.sender = await self.get_sender(user, self.conversation_id)
+        if self.sender is None:
             await self.close()
             return
         
+        # Shared typing state, and this connection's expiry timer
+        self.typing_seen_key, self.typing_sent_key = typing_keys(self.conversation_id, user.id)
+        self.typing_expiry = None
+        
         # Join room group
         await self.channel_layer.group_add(
             self.room_group_name,
@@ -31,6 +58,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
         await self.accept()
     
     async def disconnect(self, close_code):
+        if getattr(self, 'typing_expiry', None) is not None:
+            await self.stop_typing()
+        
         # Leave room group
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -45,35 +75,88 @@ class ChatConsumer(AsyncWebsocketConsumer):
         if message_type == 'message':
             message_text = data.get('message', '')
             
-            # Save message to database
+            # Save message to database (one hop to the database thread)
             message = await self.save_message(
                 self.scope['user'],
                 self.conversation_id,
                 message_text
             )
             
-            # Get message data with related fields
-            message_data = await self.get_message_data(message.id)
+            # The message ends the sender's typing; receivers clear it on arrival
+            await self.clear_typing()
             
             # Send message to room group
             await self.channel_layer.group_send(
                 self.room_group_name,
                 {
                     'type': 'chat_message',
-                    'message': message_data
+                    'message': self.get_message_data(message)
                 }
             )
+        elif message_type == 'read':
+            # Read receipt: the client has read up to message_id
+            try:
+                message_id = int(data.get('message_id'))
+            except (TypeError, ValueError):
+                return
+            
+            watermark = await self.mark_read(self.scope['user'], self.conversation_id, message_id)
+            if watermark is not None:
+                await self.channel_layer.group_send(
+                    self.room_group_name,
+                    {
+                        'type': 'read_receipt',
+                        'user_id': self.scope['user'].id,
+                        'message_id': watermark
+                    }
+                )
         elif message_type == 'typing':
-            # Broadcast typing indicator
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'typing_indicator',
-                    'user_id': self.scope['user'].id,
-                    'username': self.scope['user'].username,
-                    'is_typing': data.get('is_typing', False)
-                }
-            )
+            # Coalesce keystrokes into typing state changes
+            if data.get('is_typing', False):
+                await self.start_typing()
+            elif self.typing_expiry is not None:
+                await self.stop_typing()
+    
+    async def start_typing(self):
+        await cache.aset(self.typing_seen_key, time.time(), TYPING_TTL)
+        # add() only succeeds for the first frame in each refresh period,
+        # whichever connection it comes from
+        if await cache.aadd(self.typing_sent_key, True, TYPING_REFRESH):
+            await self.send_typing(True)
+        if self.typing_expiry is None:
+            self.typing_expiry = asyncio.ensure_future(self.expire_typing())
+    
+    async def stop_typing(self):
+        await self.clear_typing()
+        await self.send_typing(False)
+    
+    async def clear_typing(self):
+        expiry, self.typing_expiry = self.typing_expiry, None
+        if expiry is not None and expiry is not asyncio.current_task():
+            expiry.cancel()
+        await cache.adelete_many([self.typing_seen_key, self.typing_sent_key])
+    
+    async def expire_typing(self):
+        """Stop typing once TYPING_TTL passes without a typing frame from any connection"""
+        while True:
+            seen = await cache.aget(self.typing_seen_key)
+            remaining = seen + TYPING_TTL - time.time() if seen is not None else 0
+            if remaining <= 0:
+                break
+            await asyncio.sleep(remaining)
+        await self.stop_typing()
+    
+    async def send_typing(self, is_typing):
+        await self.channel_layer.group_send(
+            self.room_group_name,
+            {
+                'type': 'typing_indicator',
+                'user_id': self.scope['user'].id,
+                'username': self.scope['user'].username,
+                'is_typing': is_typing,
+                'ttl': TYPING_TTL
+            }
+        )
     
     # Receive message from room group
     async def chat_message(self, event):
@@ -85,6 +168,14 @@ class ChatConsumer(AsyncWebsocketConsumer):
             'message': message
         }))
     
+    # Receive read receipt from room group
+    async def read_receipt(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'read',
+            'user_id': event['user_id'],
+            'message_id': event['message_id']
+        }))
+    
     # Receive typing indicator from room group
     async def typing_indicator(self, event):
         # Don't send typing indicator to the user who is typing
@@ -92,45 +183,91 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.send(text_data=json.dumps({
                 'type': 'typing',
                 'username': event['username'],
-                'is_typing': event['is_typing']
+                'is_typing': event['is_typing'],
+                'ttl': event.get('ttl')
             }))
     
     @database_sync_to_async
-    def is_user_participant(self, user, conversation_id):
-        try:
-            conversation = Conversation.objects.get(id=conversation_id)
-            return user in conversation.participants.all()
-        except Conversation.DoesNotExist:
-            return False
+    def get_sender(self, user, conversation_id):
+        """Sender payload for the user, or None if they are not a participant"""
+        if not membership.is_participant(conversation_id, user.id):
+            return None
+        
+        profile = Profile.objects.only('avatar').get(user_id=user.id)
+        return {
+            'id': user.id,
+            'username': user.username,
+            'profile': {
+                'avatar': profile.avatar.url if profile.avatar else None
+            }
+        }
     
     @database_sync_to_async
     def save_message(self, user, conversation_id, text):
-        conversation = Conversation.objects.get(id=conversation_id)
-        message = Message.objects.create(
-            conversation=conversation,
-            sender=user,
-            text=text
-        )
-        
-        # Update conversation's updated_at timestamp
-        conversation.save()
-        
+        with transaction.atomic():
+            message = Message.objects.create(
+                conversation_id=conversation_id,
+                sender_id=user.id,
+                text=text
+            )
+            # Bump only updated_at and the last message instead of rewriting the whole row
+            Conversation.objects.filter(id=conversation_id).update(
+                updated_at=message.created_at, last_message=message
+            )
         return message
     
     @database_sync_to_async
-    def get_message_data(self, message_id):
-        """Get message data with related fields for serialization"""
-        message = Message.objects.select_related('sender', 'sender__profile').get(id=message_id)
+    def mark_read(self, user, conversation_id, message_id):
+        return receipts.mark_read(conversation_id, user.id, message_id)
+    
+    def get_message_data(self, message):
+        """Message payload built from the saved message and the cached sender"""
         return {
             'id': message.id,
             'text': message.text,
-            'sender': {
-                'id': message.sender.id,
-                'username': message.sender.username,
-                'profile': {
-                    'avatar': message.sender.profile.avatar.url if message.sender.profile.avatar else None
-                }
-            },
+            'sender': self.sender,
             'created_at': message.created_at.isoformat(),
             'is_read': message.is_read
         }
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    """Pushes new notifications and badge counts to one user's open tabs"""
+    
+    async def connect(self):
+        user = self.scope['user']
+        if not user.is_authenticated:
+            await self.close()
+            return
+        
+        self.group_name = push.group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+        
+        # Start the tab from the current counts; changes arrive as pushes
+        await self.send(text_data=json.dumps({
+            'type': 'badges',
+            'badges': await self.get_badges(user)
+        }))
+    
+    async def disconnect(self, close_code):
+        if hasattr(self, 'group_name'):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+    
+    # Receive new notification from user group
+    async def notification_created(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'notification',
+            'notification': event['notification']
+        }))
+    
+    # Receive new badge counts from user group
+    async def badges_update(self, event):
+        await self.send(text_data=json.dumps({
+            'type': 'badges',
+            'badges': event['badges']
+        }))
+    
+    @database_sync_to_async
+    def get_badges(self, user):
+        return badges.badges_for(user)
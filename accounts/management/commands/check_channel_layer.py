@@ -0,0 +1,163 @@
+import asyncio
+import multiprocessing
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.module_loading import import_string
+
+
+def make_layer(backend, config):
+    return import_string(backend)(**config)
+
+
+def worker(index, backend, config, group, ready, results, timeout):
+    """Join the group from a separate process and report the message it receives"""
+    async def run():
+        layer = make_layer(backend, config)
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        ready.put(index)
+        try:
+            message = await asyncio.wait_for(layer.receive(channel), timeout)
+            results.put((index, os.getpid(), message.get('text')))
+        except asyncio.TimeoutError:
+            results.put((index, os.getpid(), None))
+        finally:
+            await layer.group_discard(group, channel)
+
+    asyncio.run(run())
+
+
+class Command(BaseCommand):
+    help = (
+        'Check that group messages reach consumers in other processes through the channel layer. '
+        'Uses the configured layer, or throwaway local Redis stand-ins with --local-redis.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4)
+        parser.add_argument('--timeout', type=float, default=10.0)
+        parser.add_argument('--local-redis', type=int, default=0, metavar='SHARDS',
+                            help='Start this many local Redis stand-ins and shard across them')
+        parser.add_argument('--stand-in', choices=['redis-server', 'fakeredis'], default='redis-server',
+                            help='What --local-redis starts: redis-server processes or fakeredis TCP servers')
+
+    def handle(self, *args, **options):
+        servers = []
+        try:
+            if options['local_redis']:
+                start = self.spawn_redis if options['stand_in'] == 'redis-server' else self.start_fakeredis
+                servers = [start() for _ in range(options['local_redis'])]
+                backend = 'channels_redis.core.RedisChannelLayer'
+                config = {'hosts': [f'redis://127.0.0.1:{port}/0' for _, port in servers]}
+            else:
+                layer_settings = settings.CHANNEL_LAYERS['default']
+                backend = layer_settings['BACKEND']
+                config = layer_settings.get('CONFIG', {})
+                if backend.endswith('InMemoryChannelLayer'):
+                    raise CommandError(
+                        'The in-memory channel layer only delivers within one process; '
+                        'set CHANNEL_REDIS_URLS or pass --local-redis'
+                    )
+            self.run_check(backend, config, options['workers'], options['timeout'])
+        finally:
+            for stop, _ in servers:
+                stop()
+
+    def run_check(self, backend, config, workers, timeout):
+        hosts = config.get('hosts', [])
+        self.stdout.write(f'Checking {backend} with {len(hosts) or 1} shard(s) and {workers} worker processes')
+
+        context = multiprocessing.get_context('spawn')
+        ready = context.Queue()
+        results = context.Queue()
+        group = f'layer_check_{uuid.uuid4().hex}'
+        processes = [
+            context.Process(target=worker, args=(index, backend, config, group, ready, results, timeout))
+            for index in range(workers)
+        ]
+        for process in processes:
+            process.start()
+
+        try:
+            for _ in range(workers):
+                ready.get(timeout=timeout)
+
+            text = uuid.uuid4().hex
+            layer = make_layer(backend, config)
+            asyncio.run(layer.group_send(group, {'type': 'layer.check', 'text': text}))
+
+            received = [results.get(timeout=timeout + 5) for _ in range(workers)]
+        except queue.Empty:
+            raise CommandError('Workers did not report in time; see their output above')
+        except Exception as exc:
+            raise CommandError(f'Channel layer check failed: {exc!r}')
+        finally:
+            for process in processes:
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+
+        failed = [index for index, _, got in received if got != text]
+        for index, pid, got in sorted(received):
+            status = 'ok' if got == text else 'MISSED'
+            self.stdout.write(f'  worker {index} (pid {pid}): {status}')
+        if failed:
+            raise CommandError(f'{len(failed)} of {workers} workers missed the group message')
+        self.stdout.write(self.style.SUCCESS(f'All {workers} workers received the group message'))
+
+    def free_port(self):
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            return sock.getsockname()[1]
+
+    def spawn_redis(self):
+        """A redis-server process on a free port; returns (stop, port)"""
+        binary = shutil.which('redis-server')
+        if binary is None:
+            raise CommandError('--stand-in redis-server needs redis-server on PATH')
+
+        port = self.free_port()
+        process = subprocess.Popen(
+            [binary, '--port', str(port), '--save', '', '--appendonly', 'no'],
+            stdout=subprocess.DEVNULL,
+        )
+
+        def stop():
+            process.terminate()
+            process.wait()
+
+        deadline = time.monotonic() + 5
+        while time.monotonic() < deadline:
+            try:
+                socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+                return stop, port
+            except OSError:
+                time.sleep(0.05)
+        stop()
+        raise CommandError(f'redis-server did not start on port {port}')
+
+    def start_fakeredis(self):
+        """A fakeredis TCP server in this process; returns (stop, port)"""
+        try:
+            from fakeredis import TcpFakeServer
+        except ImportError:
+            raise CommandError('--stand-in fakeredis needs the fakeredis package (and lupa for Lua scripts)')
+
+        port = self.free_port()
+        server = TcpFakeServer(('127.0.0.1', port), server_type='redis')
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+
+        def stop():
+            server.shutdown()
+            server.server_close()
+
+        return stop, port
@@ -0,0 +1,20 @@
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand
+
+from accounts import suggestions
+
+
+class Command(BaseCommand):
+    help = 'Recompute friend-of-friend follow suggestions for every user (or the given usernames)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('usernames', nargs='*')
+        parser.add_argument('--batch-size', type=int, default=suggestions.BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by('id')
+        if options['usernames']:
+            users = users.filter(username__in=options['usernames'])
+
+        total = suggestions.rebuild(users.values_list('id', flat=True), batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Stored {total} follow suggestions'))
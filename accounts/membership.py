@@ -0,0 +1,43 @@
+"""
+Conversation membership cache.
+
+The participant ids of each conversation are cached under one key per
+conversation, shared by ``ChatConsumer`` and the message REST views, so
+authorizing a connect or a send is a cache hit rather than a join. An
+``m2m_changed`` receiver drops the entry whenever participants change.
+That only reaches every worker because they share one cache (Redis, see
+CACHE_REDIS_URL in settings); a per-process cache would keep letting a
+removed user in through other workers until the entry expired.
+"""
+from django.core.cache import cache
+
+from .models import Conversation
+
+
+CACHE_TIMEOUT = 60 * 60
+
+
+def cache_key(conversation_id):
+    return f'conversation:{conversation_id}:participants'
+
+
+def participant_ids(conversation_id):
+    """Ids of the conversation's participants (empty if it does not exist)"""
+    key = cache_key(conversation_id)
+    user_ids = cache.get(key)
+    if user_ids is None:
+        user_ids = frozenset(
+            Conversation.participants.through.objects.filter(
+                conversation_id=conversation_id
+            ).values_list('user_id', flat=True)
+        )
+        cache.set(key, user_ids, CACHE_TIMEOUT)
+    return user_ids
+
+
+def is_participant(conversation_id, user_id):
+    return user_id in participant_ids(conversation_id)
+
+
+def invalidate(conversation_ids):
+    cache.delete_many([cache_key(conversation_id) for conversation_id in conversation_ids])
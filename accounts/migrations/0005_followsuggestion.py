@@ -0,0 +1,71 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:18
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, F
+
+
+def seed_suggestions(apps, schema_editor):
+    """Score friend-of-friend candidates for existing follow edges"""
+    Profile = apps.get_model('accounts', 'Profile')
+    FollowSuggestion = apps.get_model('accounts', 'FollowSuggestion')
+    Follow = Profile.following.through
+    
+    followed = {}
+    for user_id, candidate_id in Follow.objects.values_list('from_profile__user_id', 'to_profile__user_id'):
+        followed.setdefault(user_id, set()).add(candidate_id)
+    
+    paths = (
+        Follow.objects.filter(from_profile__followers__isnull=False)
+        .values(user_id=F('from_profile__followers__user_id'), candidate_id=F('to_profile__user_id'))
+        .annotate(score=Count('*'))
+    )
+    FollowSuggestion.objects.bulk_create([
+        FollowSuggestion(user_id=path['user_id'], candidate_id=path['candidate_id'], score=path['score'])
+        for path in paths.iterator()
+        if path['candidate_id'] != path['user_id']
+        and path['candidate_id'] not in followed.get(path['user_id'], ())
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0004_profile_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FollowSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('score', models.IntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='profile',
+            index=models.Index(fields=['-followers_count'], name='accounts_profile_popular_idx'),
+        ),
+        migrations.AddField(
+            model_name='followsuggestion',
+            name='candidate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='followsuggestion',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follow_suggestions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='followsuggestion',
+            index=models.Index(fields=['user', '-score', '-candidate'], name='accounts_suggestion_rank_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='followsuggestion',
+            unique_together={('user', 'candidate')},
+        ),
+        migrations.RunPython(seed_suggestions, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,66 @@
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_follow_edges(apps, schema_editor):
+    """Move rows from the implicit M2M table into Follow"""
+    Profile = apps.get_model('accounts', 'Profile')
+    Follow = apps.get_model('accounts', 'Follow')
+    
+    edges = Profile.following.through.objects.values_list('from_profile_id', 'to_profile_id')
+    Follow.objects.bulk_create([
+        Follow(follower_id=follower_id, followed_id=followed_id)
+        for follower_id, followed_id in edges.iterator()
+    ], batch_size=1000)
+
+
+def copy_follow_edges_back(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    Follow = apps.get_model('accounts', 'Follow')
+    Through = Profile.following.through
+    
+    edges = Follow.objects.values_list('follower_id', 'followed_id')
+    Through.objects.bulk_create([
+        Through(from_profile_id=follower_id, to_profile_id=followed_id)
+        for follower_id, followed_id in edges.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0005_followsuggestion'),
+        # Earlier posts data migrations read the implicit follow table
+        ('posts', '0006_explorecandidate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('followed', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='follower_edges', to='accounts.profile')),
+                ('follower', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='following_edges', to='accounts.profile')),
+            ],
+            options={
+                'indexes': [
+                    models.Index(fields=['follower', '-created_at'], name='accounts_following_idx'),
+                    models.Index(fields=['followed', '-created_at'], name='accounts_followers_idx'),
+                ],
+                'constraints': [
+                    models.UniqueConstraint(fields=('follower', 'followed'), name='accounts_follow_unique'),
+                ],
+            },
+        ),
+        migrations.RunPython(copy_follow_edges, copy_follow_edges_back),
+        migrations.RemoveField(
+            model_name='profile',
+            name='following',
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='following',
+            field=models.ManyToManyField(blank=True, related_name='followers', through='accounts.Follow', through_fields=('follower', 'followed'), to='accounts.profile'),
+        ),
+    ]
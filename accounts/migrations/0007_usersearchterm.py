@@ -0,0 +1,104 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:22
+
+import re
+import unicodedata
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copy of accounts.search.terms_for as of this migration, so later
+# changes to the search index cannot change what this migration writes
+USERNAME, NAME, BIO, TRIGRAM = 0, 1, 2, 3
+MAX_TERM_LENGTH = 64
+MAX_BIO_WORDS = 50
+
+_word_separators = re.compile(r'[^a-z0-9]+')
+_username_characters = re.compile(r'[^a-z0-9_.]+')
+
+
+def normalize(text):
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def words(text):
+    return [word[:MAX_TERM_LENGTH] for word in _word_separators.split(normalize(text)) if word]
+
+
+def trigrams(text):
+    text = normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def terms_for(username, first_name, last_name, bio, with_trigrams):
+    username = _username_characters.sub('', normalize(username))[:MAX_TERM_LENGTH]
+    terms = {(username, USERNAME)}
+    terms.update((word, USERNAME) for word in words(username))
+    terms.update((word, NAME) for word in words(f'{first_name} {last_name}'))
+    terms.update((word, BIO) for word in words(bio)[:MAX_BIO_WORDS])
+    if with_trigrams:
+        for text in (username, first_name, last_name):
+            terms.update((trigram, TRIGRAM) for trigram in trigrams(text))
+    return terms
+
+
+def index_existing_users(apps, schema_editor):
+    # PostgreSQL matches substrings with the pg_trgm index instead of trigram rows
+    with_trigrams = schema_editor.connection.vendor != 'postgresql'
+    
+    User = apps.get_model('auth', 'User')
+    Profile = apps.get_model('accounts', 'Profile')
+    UserSearchTerm = apps.get_model('accounts', 'UserSearchTerm')
+    
+    bios = dict(Profile.objects.values_list('user_id', 'bio'))
+    for user in User.objects.iterator():
+        UserSearchTerm.objects.bulk_create([
+            UserSearchTerm(user_id=user.id, term=term, kind=kind)
+            for term, kind in terms_for(
+                user.username, user.first_name, user.last_name, bios.get(user.id, ''), with_trigrams
+            )
+        ], ignore_conflicts=True)
+
+
+def create_trigram_index(apps, schema_editor):
+    """Native substring index on PostgreSQL; other databases use trigram rows"""
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+    schema_editor.execute(
+        'CREATE INDEX IF NOT EXISTS accounts_search_term_trgm '
+        'ON accounts_usersearchterm USING gin (term gin_trgm_ops)'
+    )
+
+
+def drop_trigram_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute('DROP INDEX IF EXISTS accounts_search_term_trgm')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0006_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserSearchTerm',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(max_length=64)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(0, 'Username'), (1, 'Name'), (2, 'Bio'), (3, 'Trigram')])),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='search_terms', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['term', 'kind'], name='accounts_search_term_idx')],
+                'unique_together': {('user', 'term', 'kind')},
+            },
+        ),
+        migrations.RunPython(create_trigram_index, drop_trigram_index),
+        migrations.RunPython(index_existing_users, migrations.RunPython.noop),
+    ]
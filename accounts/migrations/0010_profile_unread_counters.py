@@ -0,0 +1,44 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:29
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def populate_counters(apps, schema_editor):
+    Profile = apps.get_model('accounts', 'Profile')
+    Notification = apps.get_model('accounts', 'Notification')
+    Message = apps.get_model('accounts', 'Message')
+    
+    def unread_count(rows, field):
+        rows = rows.filter(**{field: OuterRef('user')}).order_by().values(field)
+        return Coalesce(Subquery(rows.annotate(total=Count('*')).values('total')), 0)
+    
+    Profile.objects.update(
+        unread_notifications_count=unread_count(Notification.objects.filter(is_read=False), 'recipient'),
+        unread_messages_count=unread_count(
+            Message.objects.filter(is_read=False).exclude(sender=OuterRef('user')),
+            'conversation__participants',
+        ),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0009_notification_aggregation'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='profile',
+            name='unread_messages_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='profile',
+            name='unread_notifications_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(populate_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:36
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Max
+
+
+def seed_watermarks(apps, schema_editor):
+    """Start each participant's watermark at the newest message they had read"""
+    Conversation = apps.get_model('accounts', 'Conversation')
+    ConversationRead = apps.get_model('accounts', 'ConversationRead')
+    Message = apps.get_model('accounts', 'Message')
+    Profile = apps.get_model('accounts', 'Profile')
+    
+    unread = {}
+    for conversation_id, user_id in Conversation.participants.through.objects.values_list('conversation_id', 'user_id'):
+        from_others = Message.objects.filter(conversation_id=conversation_id).exclude(sender_id=user_id)
+        watermark = from_others.filter(is_read=True).aggregate(last=Max('id'))['last'] or 0
+        ConversationRead.objects.create(
+            conversation_id=conversation_id, user_id=user_id, last_read_message_id=watermark
+        )
+        unread[user_id] = unread.get(user_id, 0) + from_others.filter(id__gt=watermark).count()
+    
+    for user_id, count in unread.items():
+        Profile.objects.filter(user_id=user_id).update(unread_messages_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0010_profile_unread_counters'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ConversationRead',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_read_message_id', models.BigIntegerField(default=0)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='accounts_message_conv_idx'),
+        ),
+        migrations.AddField(
+            model_name='conversationread',
+            name='conversation',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reads', to='accounts.conversation'),
+        ),
+        migrations.AddField(
+            model_name='conversationread',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='conversation_reads', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AlterUniqueTogether(
+            name='conversationread',
+            unique_together={('conversation', 'user')},
+        ),
+        migrations.RunPython(seed_watermarks, migrations.RunPython.noop),
+    ]
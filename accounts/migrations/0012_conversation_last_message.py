@@ -0,0 +1,29 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import OuterRef, Subquery
+
+
+def point_at_last_messages(apps, schema_editor):
+    Conversation = apps.get_model('accounts', 'Conversation')
+    Message = apps.get_model('accounts', 'Message')
+    Conversation.objects.update(last_message=Subquery(
+        Message.objects.filter(conversation=OuterRef('pk')).order_by('-id').values('id')[:1]
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0011_conversationread'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='conversation',
+            name='last_message',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='accounts.message'),
+        ),
+        migrations.RunPython(point_at_last_messages, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:58
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def seed_actors(apps, schema_editor):
+    # Only the latest actor of existing aggregate rows is known
+    Notification = apps.get_model('accounts', 'Notification')
+    NotificationActor = apps.get_model('accounts', 'NotificationActor')
+    rows = Notification.objects.filter(window__isnull=False).values_list('id', 'actor_id').iterator()
+    NotificationActor.objects.bulk_create(
+        (NotificationActor(notification_id=pk, actor_id=actor_id) for pk, actor_id in rows),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0012_conversation_last_message'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='actor_rows', to='accounts.notification')),
+            ],
+            options={
+                'unique_together': {('notification', 'actor')},
+            },
+        ),
+        migrations.RunPython(seed_actors, migrations.RunPython.noop),
+    ]
@@ -1,32 +1,74 @@
 from django.db import models
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import m2m_changed, post_delete, post_save
 from django.dispatch import receiver
 
+from core.models import DerivedFieldsMixin
 
-class Profile(models.Model):
+
+class Profile(DerivedFieldsMixin, models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='profile')
     avatar = models.ImageField(upload_to='avatars/', blank=True, null=True)
     bio = models.TextField(max_length=500, blank=True)
     website = models.URLField(max_length=200, blank=True)
-    following = models.ManyToManyField('self', symmetrical=False, related_name='followers', blank=True)
+    following = models.ManyToManyField(
+        'self', through='Follow', through_fields=('follower', 'followed'),
+        symmetrical=False, related_name='followers', blank=True
+    )
+    # Denormalized counters, kept in step with F() updates (see reconcile_counters)
+    posts_count = models.PositiveIntegerField(default=0)
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    # Unread badges, see accounts.badges
+    unread_notifications_count = models.PositiveIntegerField(default=0)
+    unread_messages_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    COUNTER_FIELDS = (
+        'posts_count', 'followers_count', 'following_count',
+        'unread_notifications_count', 'unread_messages_count',
+    )
+    DERIVED_FIELDS = COUNTER_FIELDS
+    
+    class Meta:
+        indexes = [
+            models.Index(fields=['-followers_count'], name='accounts_profile_popular_idx'),
+        ]
+    
     def __str__(self):
         return self.user.username
+
+
+class FollowQuerySet(models.QuerySet):
+    def following_user_ids(self, user_id):
+        """User ids the given user follows"""
+        return self.filter(follower__user_id=user_id).values_list('followed__user_id', flat=True)
     
-    @property
-    def posts_count(self):
-        return self.user.posts.count()
+    def follower_user_ids(self, user_id):
+        """User ids following the given user"""
+        return self.filter(followed__user_id=user_id).values_list('follower__user_id', flat=True)
+
+
+class Follow(models.Model):
+    """A follow edge between two profiles"""
+    follower = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='following_edges')
+    followed = models.ForeignKey(Profile, on_delete=models.CASCADE, related_name='follower_edges')
+    created_at = models.DateTimeField(auto_now_add=True)
     
-    @property
-    def followers_count(self):
-        return self.followers.count()
+    objects = FollowQuerySet.as_manager()
     
-    @property
-    def following_count(self):
-        return self.following.count()
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['follower', 'followed'], name='accounts_follow_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['follower', '-created_at'], name='accounts_following_idx'),
+            models.Index(fields=['followed', '-created_at'], name='accounts_followers_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.follower} follows {self.followed}"
 
 
 @receiver(post_save, sender=User)
@@ -40,11 +82,62 @@ def save_user_profile(sender, instance, **kwargs):
     instance.profile.save()
 
 
+class FollowSuggestion(models.Model):
+    """A friend-of-friend the user does not follow yet, scored by mutual follows"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='follow_suggestions')
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.IntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('user', 'candidate')
+        indexes = [
+            models.Index(fields=['user', '-score', '-candidate'], name='accounts_suggestion_rank_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.candidate.username} for {self.user.username} ({self.score})"
+
+
+class UserSearchTerm(models.Model):
+    """A normalized word or trigram from a user's username, name or bio (see accounts.search)"""
+    USERNAME = 0
+    NAME = 1
+    BIO = 2
+    TRIGRAM = 3
+    KIND_CHOICES = (
+        (USERNAME, 'Username'),
+        (NAME, 'Name'),
+        (BIO, 'Bio'),
+        (TRIGRAM, 'Trigram'),
+    )
+    
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='search_terms')
+    term = models.CharField(max_length=64)
+    kind = models.PositiveSmallIntegerField(choices=KIND_CHOICES)
+    
+    class Meta:
+        unique_together = ('user', 'term', 'kind')
+        indexes = [
+            models.Index(fields=['term', 'kind'], name='accounts_search_term_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.term} -> {self.user_id}"
+
+
+@receiver(post_save, sender=Profile)
+def update_search_terms(sender, instance, **kwargs):
+    from .search import index_user
+    index_user(instance.user)
+
+
 class Notification(models.Model):
     NOTIFICATION_TYPES = (
         ('like', 'Like'),
         ('comment', 'Comment'),
         ('follow', 'Follow'),
+        ('mention', 'Mention'),
     )
     
     recipient = models.ForeignKey(User, on_delete=models.CASCADE, related_name='notifications')
@@ -52,18 +145,60 @@ class Notification(models.Model):
     verb = models.CharField(max_length=20, choices=NOTIFICATION_TYPES)
     target_type = models.CharField(max_length=50, blank=True)
     target_id = models.IntegerField(blank=True, null=True)
+    # Aggregated rows fold every event on the same target within a window
+    # into one row: actor is the latest actor, actors_count how many acted
+    window = models.DateTimeField(blank=True, null=True)
+    actors_count = models.PositiveIntegerField(default=1)
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['recipient', '-created_at', '-id'], name='accounts_notification_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(
+                fields=['recipient', 'verb', 'target_type', 'target_id', 'window'],
+                condition=models.Q(window__isnull=False),
+                name='accounts_notification_aggregate',
+            ),
+        ]
     
     def __str__(self):
         return f"{self.actor.username} {self.verb} - {self.recipient.username}"
+    
+    @property
+    def others_count(self):
+        return self.actors_count - 1
+
+
+class NotificationActor(models.Model):
+    """Who has acted on an aggregated notification, so each person is counted once"""
+    notification = models.ForeignKey(Notification, on_delete=models.CASCADE, related_name='actor_rows')
+    actor = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    
+    class Meta:
+        unique_together = ('notification', 'actor')
+    
+    def __str__(self):
+        return f"{self.actor_id} on notification {self.notification_id}"
+
+
+@receiver(post_delete, sender=Notification)
+def release_notification_badge(sender, instance, **kwargs):
+    if not instance.is_read:
+        from .badges import adjust
+        adjust([instance.recipient_id], notifications=-1)
 
 
 class Conversation(models.Model):
     participants = models.ManyToManyField(User, related_name='conversations')
+    # Newest message, kept by the write paths so the inbox needs no per-row lookup;
+    # updated_at doubles as its timestamp
+    last_message = models.ForeignKey(
+        'Message', on_delete=models.SET_NULL, null=True, blank=True, related_name='+'
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -73,37 +208,99 @@ class Conversation(models.Model):
     def __str__(self):
         return f"Conversation {self.id}"
     
-    @property
-    def last_message(self):
-        return self.messages.first()
-    
     def get_other_participant(self, user):
         """Get the other participant in the conversation"""
         return self.participants.exclude(id=user.id).first()
     
+    def last_read_message_id(self, user):
+        """The user's read watermark in this conversation (0 if nothing was read)"""
+        watermark = self.reads.filter(user=user).values_list('last_read_message_id', flat=True).first()
+        return watermark or 0
+    
+    def unread_messages(self, user):
+        """Messages from others above the user's watermark: a range over (conversation, id)"""
+        return self.messages.filter(id__gt=self.last_read_message_id(user)).exclude(sender=user)
+    
     def has_unread_messages(self, user):
         """Check if conversation has unread messages for the user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).exists()
+        return self.unread_messages(user).exists()
     
     def unread_count(self, user):
         """Get count of unread messages for the user"""
-        return self.messages.filter(is_read=False).exclude(sender=user).count()
+        return self.unread_messages(user).count()
+
+
+class ConversationRead(models.Model):
+    """How far a participant has read a conversation (read receipts)"""
+    conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='reads')
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='conversation_reads')
+    last_read_message_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        unique_together = ('conversation', 'user')
+    
+    def __str__(self):
+        return f"{self.user.username} read {self.conversation_id} up to {self.last_read_message_id}"
+
+
+@receiver(m2m_changed, sender=Conversation.participants.through)
+def invalidate_participants(sender, instance, action, reverse, pk_set, **kwargs):
+    from .membership import invalidate
+    if not reverse:
+        if action in ('post_add', 'post_remove', 'post_clear'):
+            invalidate([instance.pk])
+    elif action in ('post_add', 'post_remove'):
+        invalidate(pk_set)
+    elif action == 'pre_clear':
+        invalidate(instance.conversations.values_list('pk', flat=True))
+
+
+@receiver(post_delete, sender=Conversation)
+def forget_participants(sender, instance, **kwargs):
+    from .membership import invalidate
+    invalidate([instance.pk])
 
 
 class Message(models.Model):
     conversation = models.ForeignKey(Conversation, on_delete=models.CASCADE, related_name='messages')
     sender = models.ForeignKey(User, on_delete=models.CASCADE, related_name='sent_messages')
     text = models.TextField()
+    # Legacy per-message flag; read state now lives in ConversationRead watermarks
     is_read = models.BooleanField(default=False)
     created_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['conversation', 'id'], name='accounts_message_conv_idx'),
+        ]
     
     def __str__(self):
         return f"{self.sender.username}: {self.text[:30]}"
 
 
+@receiver(post_save, sender=Message)
+def bump_message_badges(sender, instance, created, **kwargs):
+    if created:
+        from .badges import adjust
+        recipient_ids = Conversation.participants.through.objects.filter(
+            conversation_id=instance.conversation_id
+        ).exclude(user_id=instance.sender_id).values_list('user_id', flat=True)
+        adjust(recipient_ids, messages=1)
+
+
+@receiver(post_delete, sender=Message)
+def replace_last_message(sender, instance, **kwargs):
+    # Deleting the newest message nulls the pointer; fall back to the one before it
+    Conversation.objects.filter(id=instance.conversation_id, last_message__isnull=True).update(
+        last_message=models.Subquery(
+            Message.objects.filter(conversation_id=instance.conversation_id)
+            .order_by('-id').values('id')[:1]
+        )
+    )
+
+
 class UserNote(models.Model):
     """User's personal note that appears at the top of messages"""
     user = models.OneToOneField(User, on_delete=models.CASCADE, related_name='note')
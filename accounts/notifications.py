@@ -0,0 +1,198 @@
+"""
+Notification pipeline.
+
+Callers describe what happened as ``Event`` tuples; rows are written after
+the request commits, on the background pool. Likes and comments on the
+same target are folded into one aggregate row per recipient per WINDOW
+("alice and 1,204 others liked your post"), so a viral post adds a single
+row per window instead of one per like. Other verbs are written as
+individual rows with one bulk insert. Each event is also pushed to the
+recipient's open tabs.
+
+NotificationActor holds one row per person per aggregate. actors_count only
+grows by the actor rows actually inserted, so someone liking, unliking and
+liking again is still one person.
+"""
+from collections import Counter, namedtuple
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.contrib.auth.models import User
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from core.background import defer
+from . import badges, push
+from .models import Notification, NotificationActor
+
+
+Event = namedtuple('Event', 'recipient_id actor_id verb target_type target_id')
+
+AGGREGATED_VERBS = {'like', 'comment'}
+WINDOW = timedelta(hours=24)
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def window_for(moment):
+    """Start of the aggregation window containing moment"""
+    return EPOCH + (moment - EPOCH) // WINDOW * WINDOW
+
+
+def notify(recipient_id, actor_id, verb, target_type='', target_id=None):
+    notify_many([Event(recipient_id, actor_id, verb, target_type, target_id)])
+
+
+def notify_many(events):
+    """Queue notifications for writing once the current transaction commits"""
+    events = [event for event in events if event.recipient_id != event.actor_id]
+    if events:
+        defer(write, events)
+
+
+def write(events):
+    """Write a batch of events: aggregated verbs are folded, the rest bulk inserted"""
+    now = timezone.now()
+    window = window_for(now)
+
+    single = []
+    grouped = {}
+    for event in events:
+        if event.verb in AGGREGATED_VERBS:
+            key = (event.recipient_id, event.verb, event.target_type, event.target_id)
+            grouped.setdefault(key, []).append(event.actor_id)
+        else:
+            single.append(Notification(
+                recipient_id=event.recipient_id,
+                actor_id=event.actor_id,
+                verb=event.verb,
+                target_type=event.target_type,
+                target_id=event.target_id,
+            ))
+    Notification.objects.bulk_create(single)
+
+    # Unread rows added per recipient, for the badge counters
+    unread = Counter(notification.recipient_id for notification in single)
+    missing = []
+    for key, actor_ids in grouped.items():
+        reopened = _fold(key, actor_ids, window, now)
+        if reopened is None:
+            missing.append(key)
+        else:
+            unread[key[0]] += reopened
+
+    if missing:
+        rows = [_aggregate_row(key, grouped[key], window) for key in missing]
+        try:
+            with transaction.atomic():
+                Notification.objects.bulk_create(rows)
+                NotificationActor.objects.bulk_create([
+                    NotificationActor(notification=row, actor_id=actor_id)
+                    for row, key in zip(rows, missing)
+                    for actor_id in dict.fromkeys(grouped[key])
+                ])
+            unread.update(key[0] for key in missing)
+        except IntegrityError:
+            # Another writer opened some of these windows first; fold into theirs
+            for key in missing:
+                reopened = _fold(key, grouped[key], window, now)
+                if reopened is None:
+                    reopened = _open(key, grouped[key], window, now)
+                unread[key[0]] += reopened
+
+    badges.add_notifications(unread)
+    publish(events)
+
+
+def publish(events):
+    """Push each event to the recipient's open tabs"""
+    actors = User.objects.select_related('profile').in_bulk({event.actor_id for event in events})
+    for event in events:
+        actor = actors.get(event.actor_id)
+        if actor is None:
+            continue
+        push.send(event.recipient_id, {
+            'type': 'notification.created',
+            'notification': {
+                'actor': actor.id,
+                'actor_username': actor.username,
+                'actor_avatar': actor.profile.avatar.url if actor.profile.avatar else None,
+                'verb': event.verb,
+                'target_type': event.target_type,
+                'target_id': event.target_id,
+            },
+        })
+
+
+def _aggregate_row(key, actor_ids, window):
+    recipient_id, verb, target_type, target_id = key
+    return Notification(
+        recipient_id=recipient_id,
+        actor_id=actor_ids[-1],
+        verb=verb,
+        target_type=target_type,
+        target_id=target_id,
+        window=window,
+        actors_count=len(set(actor_ids)),
+    )
+
+
+def _open(key, actor_ids, window, now):
+    """Create the aggregate row for key on its own, folding instead if it appears meanwhile"""
+    try:
+        with transaction.atomic():
+            row = _aggregate_row(key, actor_ids, window)
+            row.save()
+            _add_actors(row.pk, actor_ids)
+        return 1
+    except IntegrityError:
+        return _fold(key, actor_ids, window, now) or 0
+
+
+def _add_actors(notification_id, actor_ids):
+    """
+    Record each actor on an aggregate row once, with one INSERT. Returns how
+    many were not there yet; callers hold the row's lock, so that is exact.
+    """
+    actor_ids = set(actor_ids)
+    existing = set(NotificationActor.objects.filter(
+        notification_id=notification_id, actor_id__in=actor_ids,
+    ).values_list('actor_id', flat=True))
+    added = actor_ids - existing
+    NotificationActor.objects.bulk_create([
+        NotificationActor(notification_id=notification_id, actor_id=actor_id) for actor_id in added
+    ], ignore_conflicts=True)
+    return len(added)
+
+
+def _fold(key, actor_ids, window, now):
+    """
+    Fold actors into the open aggregate row for key. Returns None if there
+    is no row yet, 1 if a read row became unread again and 0 otherwise.
+    """
+    recipient_id, verb, target_type, target_id = key
+    with transaction.atomic():
+        # Locking the row serializes concurrent folds, so each new actor is counted once
+        notification_id = Notification.objects.select_for_update().filter(
+            recipient_id=recipient_id,
+            verb=verb,
+            target_type=target_type,
+            target_id=target_id,
+            window=window,
+        ).values_list('id', flat=True).first()
+        if notification_id is None:
+            return None
+
+        # Only actors new to this window are counted, however often they act
+        added = _add_actors(notification_id, actor_ids)
+        rows = Notification.objects.filter(pk=notification_id)
+        changes = {
+            'actor_id': actor_ids[-1],
+            'actors_count': F('actors_count') + added,
+            'is_read': False,
+            'created_at': now,
+        }
+        if rows.filter(is_read=True).update(**changes):
+            return 1
+        rows.update(**changes)
+        return 0
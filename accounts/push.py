@@ -0,0 +1,20 @@
+"""
+Server push to a user's open tabs.
+
+Every ``NotificationConsumer`` joins the group ``notifications_<user id>``,
+so code anywhere in the project can reach all of a user's connections
+through the channel layer without knowing which process holds them.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+
+def group_name(user_id):
+    return f'notifications_{user_id}'
+
+
+def send(user_id, event):
+    """Deliver a channel layer event (its 'type' names the consumer handler) to the user's tabs"""
+    layer = get_channel_layer()
+    if layer is not None:
+        async_to_sync(layer.group_send)(group_name(user_id), event)
@@ -0,0 +1,71 @@
+"""
+Read receipts.
+
+Each participant has one ``ConversationRead`` watermark: the id of the
+last message they have read. Marking a conversation read moves that
+watermark forward instead of flipping ``is_read`` on every message, so
+unread counts are a range over the ``(conversation, id)`` index. Every
+advance is broadcast to the conversation's chat group so senders see
+their messages as seen.
+"""
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.db import transaction
+
+from . import badges
+from .models import ConversationRead, Message
+
+
+def group_name(conversation_id):
+    return f'chat_{conversation_id}'
+
+
+def mark_read(conversation_id, user_id, message_id=None):
+    """
+    Move the user's watermark up to message_id (default: the latest
+    message). Returns the new watermark, or None if it did not move.
+    """
+    messages = Message.objects.filter(conversation_id=conversation_id)
+    if message_id is not None:
+        messages = messages.filter(id__lte=message_id)
+    target = messages.order_by('-id').values_list('id', flat=True).first()
+    if target is None:
+        return None
+
+    state, _ = ConversationRead.objects.get_or_create(conversation_id=conversation_id, user_id=user_id)
+    previous = state.last_read_message_id
+    if previous >= target:
+        return None
+    # Compare-and-set, so concurrent marks never move the watermark backwards
+    moved = ConversationRead.objects.filter(
+        pk=state.pk, last_read_message_id=previous
+    ).update(last_read_message_id=target)
+    if not moved:
+        return None
+
+    newly_read = Message.objects.filter(
+        conversation_id=conversation_id, id__gt=previous, id__lte=target
+    ).exclude(sender_id=user_id).count()
+    badges.adjust([user_id], messages=-newly_read)
+    return target
+
+
+def watermarks(conversation_id):
+    """{user_id: last read message id} for the conversation's readers"""
+    return dict(
+        ConversationRead.objects.filter(conversation_id=conversation_id)
+        .values_list('user_id', 'last_read_message_id')
+    )
+
+
+def broadcast(conversation_id, user_id, message_id):
+    """Tell everyone connected to the conversation how far the user has read"""
+    def send():
+        layer = get_channel_layer()
+        if layer is not None:
+            async_to_sync(layer.group_send)(group_name(conversation_id), {
+                'type': 'read_receipt',
+                'user_id': user_id,
+                'message_id': message_id,
+            })
+    transaction.on_commit(send)
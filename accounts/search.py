@@ -0,0 +1,157 @@
+"""
+User search.
+
+Usernames, names and bios are broken into normalized words and username /
+name trigrams and stored in ``UserSearchTerm`` whenever a profile is saved.
+Queries then become index lookups instead of ``icontains`` scans:
+
+* prefix matches are a range scan ``term >= q AND term < q + U+10FFFF`` on
+  the ``(term, kind)`` B-tree, which works on every database;
+* substring / fuzzy matches count shared trigrams, or on PostgreSQL use the
+  ``gin_trgm_ops`` index created by the migration. A user must share at
+  least MIN_TRIGRAM_SIMILARITY of the query's trigrams, so one common
+  trigram ("ser" in every "user…") is not a match.
+
+Exact username matches rank first, then username, name and bio prefixes,
+then substring matches.
+"""
+import math
+import re
+import unicodedata
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.models import Count, Q
+
+from .models import UserSearchTerm
+
+
+MAX_TERM_LENGTH = 64
+MAX_BIO_WORDS = 50
+CANDIDATE_LIMIT = 200
+
+EXACT_USERNAME_SCORE = 100
+PREFIX_SCORES = {
+    UserSearchTerm.USERNAME: 60,
+    UserSearchTerm.NAME: 40,
+    UserSearchTerm.BIO: 10,
+}
+SUBSTRING_SCORE = 30
+# Share of the query's trigrams a user must have to count as a substring match
+MIN_TRIGRAM_SIMILARITY = 0.6
+
+_word_separators = re.compile(r'[^a-z0-9]+')
+_username_characters = re.compile(r'[^a-z0-9_.]+')
+
+
+def normalize(text):
+    """Lowercase and strip accents so 'José' matches 'jose'"""
+    text = unicodedata.normalize('NFKD', text or '')
+    return ''.join(c for c in text if not unicodedata.combining(c)).lower()
+
+
+def words(text):
+    return [word[:MAX_TERM_LENGTH] for word in _word_separators.split(normalize(text)) if word]
+
+
+def trigrams(text):
+    text = normalize(text)
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def native_trigram_index():
+    return connection.vendor == 'postgresql'
+
+
+def terms_for(username, first_name='', last_name='', bio=''):
+    """The (term, kind) pairs indexed for one user"""
+    username = _username_characters.sub('', normalize(username))[:MAX_TERM_LENGTH]
+    terms = {(username, UserSearchTerm.USERNAME)}
+    terms.update((word, UserSearchTerm.USERNAME) for word in words(username))
+    terms.update((word, UserSearchTerm.NAME) for word in words(f'{first_name} {last_name}'))
+    terms.update((word, UserSearchTerm.BIO) for word in words(bio)[:MAX_BIO_WORDS])
+    if not native_trigram_index():
+        for text in (username, first_name, last_name):
+            terms.update((trigram, UserSearchTerm.TRIGRAM) for trigram in trigrams(text))
+    return terms
+
+
+def index_user(user):
+    """Bring a user's search terms up to date, writing only what changed"""
+    profile = getattr(user, 'profile', None)
+    wanted = terms_for(user.username, user.first_name, user.last_name, profile.bio if profile else '')
+    current = set(UserSearchTerm.objects.filter(user=user).values_list('term', 'kind'))
+
+    stale = Q()
+    for term, kind in current - wanted:
+        stale |= Q(term=term, kind=kind)
+    if stale:
+        UserSearchTerm.objects.filter(stale, user=user).delete()
+    UserSearchTerm.objects.bulk_create([
+        UserSearchTerm(user=user, term=term, kind=kind) for term, kind in wanted - current
+    ], ignore_conflicts=True)
+
+
+def _prefix_matches(query):
+    return UserSearchTerm.objects.filter(
+        term__gte=query,
+        term__lt=query + '\U0010ffff',
+        kind__in=list(PREFIX_SCORES),
+    ).order_by('term').values_list('user_id', 'term', 'kind')[:CANDIDATE_LIMIT]
+
+
+def _substring_matches(query):
+    """(user_id, similarity) pairs for users whose username or name contains the query"""
+    if native_trigram_index():
+        rows = UserSearchTerm.objects.filter(
+            term__contains=query,
+            kind__in=[UserSearchTerm.USERNAME, UserSearchTerm.NAME],
+        ).values_list('user_id', flat=True).distinct()[:CANDIDATE_LIMIT]
+        return [(user_id, 1.0) for user_id in rows]
+
+    wanted = trigrams(query)
+    rows = UserSearchTerm.objects.filter(
+        kind=UserSearchTerm.TRIGRAM, term__in=wanted
+    ).values('user_id').annotate(hits=Count('*')).filter(
+        hits__gte=math.ceil(len(wanted) * MIN_TRIGRAM_SIMILARITY)
+    ).order_by('-hits')[:CANDIDATE_LIMIT]
+    return [(row['user_id'], row['hits'] / len(wanted)) for row in rows]
+
+
+def search(query, limit=20):
+    """User ids matching the query, best match first"""
+    query = normalize(query).strip()
+    if not query:
+        return []
+    compact = _username_characters.sub('', query)[:MAX_TERM_LENGTH]
+    prefixes = {compact, *words(query)} - {''}
+
+    scores = {}
+
+    def offer(user_id, score):
+        if score > scores.get(user_id, 0):
+            scores[user_id] = score
+
+    for prefix in prefixes:
+        for user_id, term, kind in _prefix_matches(prefix):
+            if kind == UserSearchTerm.USERNAME and term == compact:
+                offer(user_id, EXACT_USERNAME_SCORE)
+            else:
+                offer(user_id, PREFIX_SCORES[kind])
+
+    if len(compact) >= 3:
+        for user_id, similarity in _substring_matches(compact):
+            offer(user_id, SUBSTRING_SCORE * similarity)
+
+    ranked = sorted(scores.items(), key=lambda item: (-item[1], item[0]))
+    return [user_id for user_id, _ in ranked[:limit]]
+
+
+def rebuild(batch_size=1000):
+    """Reindex every user"""
+    users = User.objects.select_related('profile').order_by('id')
+    count = 0
+    for user in users.iterator(chunk_size=batch_size):
+        index_user(user)
+        count += 1
+    return count
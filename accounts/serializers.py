@@ -1,6 +1,19 @@
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import Profile, Notification, Conversation, Message
+from . import targets
+from .viewer_state import ViewerState
+from core import renditions
+from core.serializers import BatchedListSerializer
+
+
+class UserListSerializer(BatchedListSerializer):
+    """Resolves is_following for every user in the list with one query"""
+    
+    def prepare(self, users):
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            state.resolve(user_ids=[user.id for user in users])
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -10,19 +23,21 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = ('id', 'username', 'email', 'first_name', 'last_name', 'profile', 'is_following')
+        list_serializer_class = UserListSerializer
     
     def get_profile(self, obj):
         if hasattr(obj, 'profile'):
             return {
                 'avatar': obj.profile.avatar.url if obj.profile.avatar else None,
+                'avatar_renditions': renditions.urls_for(obj.profile.avatar, renditions.AVATAR),
                 'bio': obj.profile.bio
             }
         return None
     
     def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj.profile in request.user.profile.following.all()
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            return state.is_following(obj)
         return False
 
 
@@ -34,10 +49,11 @@ class ProfileSerializer(serializers.ModelSerializer):
     followers_count = serializers.IntegerField(read_only=True)
     following_count = serializers.IntegerField(read_only=True)
     is_following = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = Profile
-        fields = ('id', 'user', 'username', 'email', 'avatar', 'bio', 'website',
+        fields = ('id', 'user', 'username', 'email', 'avatar', 'renditions', 'bio', 'website',
                   'posts_count', 'followers_count', 'following_count', 'is_following',
                   'created_at', 'updated_at')
         read_only_fields = ('created_at', 'updated_at')
@@ -51,54 +67,104 @@ class ProfileSerializer(serializers.ModelSerializer):
         }
     
     def get_is_following(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return obj in request.user.profile.following.all()
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            return state.is_following(obj.user)
         return False
     
+    def get_renditions(self, obj):
+        return {'avatar': renditions.urls_for(obj.avatar, renditions.PROFILE_AVATAR)}
+
+
+class NotificationListSerializer(BatchedListSerializer):
+    """Loads the targets of every notification in the list, one query per target type"""
+    
+    def prepare(self, notifications):
+        targets.hydrate(notifications)
 
 
 class NotificationSerializer(serializers.ModelSerializer):
     actor_username = serializers.CharField(source='actor.username', read_only=True)
     actor_avatar = serializers.ImageField(source='actor.profile.avatar', read_only=True)
     target_image = serializers.SerializerMethodField()
+    target_exists = serializers.SerializerMethodField()
+    others_count = serializers.IntegerField(read_only=True)
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = Notification
         fields = ('id', 'actor', 'actor_username', 'actor_avatar', 'verb', 
-                  'target_type', 'target_id', 'target_image', 'is_read', 'created_at')
-        read_only_fields = ('actor', 'verb', 'target_type', 'target_id', 'created_at')
+                  'target_type', 'target_id', 'target_image', 'target_exists', 'renditions',
+                  'actors_count', 'others_count', 'is_read', 'created_at')
+        read_only_fields = ('actor', 'verb', 'target_type', 'target_id', 'actors_count', 'created_at')
+        list_serializer_class = NotificationListSerializer
     
     def get_target_image(self, obj):
         """Get the image URL for the notification target"""
-        try:
-            if obj.target_type == 'post' and obj.target_id:
-                from posts.models import Post
-                post = Post.objects.get(id=obj.target_id)
-                if post.image:
-                    return post.image.url
-            elif obj.verb == 'follow':
-                # For follow notifications, return actor's avatar
-                if hasattr(obj.actor, 'profile') and obj.actor.profile.avatar:
-                    return obj.actor.profile.avatar.url
-        except Exception:
-            pass
+        if obj.target_type == 'post':
+            post = targets.target_of(obj)
+            if post is not None and post.image:
+                return post.image.url
+        elif obj.verb == 'follow':
+            # For follow notifications, return actor's avatar
+            if hasattr(obj.actor, 'profile') and obj.actor.profile.avatar:
+                return obj.actor.profile.avatar.url
         return None
+    
+    def get_renditions(self, obj):
+        """Small renditions of the actor avatar and target image shown in the list"""
+        target_image = target_variants = None
+        if obj.target_type == 'post':
+            post = targets.target_of(obj)
+            if post is not None:
+                target_image, target_variants = post.image, post.media_variants
+        return {
+            'actor_avatar': renditions.avatar_urls(obj.actor),
+            'target_image': renditions.urls_for(target_image, renditions.NOTIFICATION_TARGET, target_variants),
+        }
+    
+    def get_target_exists(self, obj):
+        """False when the target (a deleted post, say) no longer exists"""
+        if obj.target_type in targets.LOADERS:
+            return targets.target_of(obj) is not None
+        return True
 
 
 class MessageSerializer(serializers.ModelSerializer):
     sender = UserSerializer(read_only=True)
     timestamp = serializers.DateTimeField(source='created_at', read_only=True)
+    is_read = serializers.SerializerMethodField()
     
     class Meta:
         model = Message
         fields = ('id', 'conversation', 'sender', 'text', 'is_read', 'timestamp', 'created_at')
         read_only_fields = ('sender', 'conversation', 'created_at', 'timestamp')
+    
+    def get_is_read(self, obj):
+        """Whether another participant's read watermark has reached the message"""
+        watermarks = self.context.get('read_watermarks')
+        if watermarks is None:
+            return obj.is_read
+        return any(
+            last_read >= obj.id
+            for user_id, last_read in watermarks.items() if user_id != obj.sender_id
+        )
+
+
+class ConversationListSerializer(BatchedListSerializer):
+    """Resolves is_following for the participants of every conversation with one query"""
+    
+    def prepare(self, conversations):
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            state.resolve(user_ids={
+                user.id for conversation in conversations for user in conversation.participants.all()
+            })
 
 
 class ConversationSerializer(serializers.ModelSerializer):
     participants = serializers.SerializerMethodField()
-    last_message = MessageSerializer(read_only=True)
+    last_message = serializers.SerializerMethodField()
     other_user = serializers.SerializerMethodField()
     current_user_id = serializers.SerializerMethodField()
     unread_count = serializers.SerializerMethodField()
@@ -107,17 +173,27 @@ class ConversationSerializer(serializers.ModelSerializer):
         model = Conversation
         fields = ('id', 'participants', 'last_message', 'other_user', 'current_user_id', 'unread_count', 'created_at', 'updated_at')
         read_only_fields = ('created_at', 'updated_at')
+        list_serializer_class = ConversationListSerializer
     
     def get_participants(self, obj):
-        request = self.context.get('request')
-        return UserSerializer(obj.participants.all(), many=True, context={'request': request}).data
+        return UserSerializer(obj.participants.all(), many=True, context=self.context).data
+    
+    def get_last_message(self, obj):
+        if obj.last_message is None:
+            return None
+        # Seen state comes from this conversation's watermarks (prefetched by the inbox)
+        context = dict(self.context, read_watermarks={
+            read.user_id: read.last_read_message_id for read in obj.reads.all()
+        })
+        return MessageSerializer(obj.last_message, context=context).data
     
     def get_other_user(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
-            participants = obj.participants.exclude(id=request.user.id)
-            if participants.exists():
-                return UserSerializer(participants.first(), context={'request': request}).data
+            # Filtered in Python so prefetched participants are reused
+            for user in obj.participants.all():
+                if user.id != request.user.id:
+                    return UserSerializer(user, context=self.context).data
         return None
     
     def get_current_user_id(self, obj):
@@ -129,6 +205,8 @@ class ConversationSerializer(serializers.ModelSerializer):
     def get_unread_count(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            if hasattr(obj, 'unread'):
+                return obj.unread
             return obj.unread_count(request.user)
         return 0
 
@@ -0,0 +1,127 @@
+"""
+Precomputed follow suggestions.
+
+``FollowSuggestion`` stores, for every user U, the accounts C that U does
+not follow yet together with the number of people U follows who follow C
+(the mutual count). Scores are maintained incrementally from follow and
+unfollow events, so ``get_suggestions`` is one range scan over the
+``(user, score)`` index. ``rebuild_suggestions`` recomputes everything.
+"""
+from django.db.models import Count, F
+
+from .models import Follow, FollowSuggestion, Profile
+
+
+BATCH_SIZE = 1000
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), BATCH_SIZE):
+        yield ids[start:start + BATCH_SIZE]
+
+
+def _add(user_ids, candidate_ids, delta):
+    """
+    Move the score of every (user, candidate) pair by delta, creating missing
+    rows on increments. Callers pass one id on one side and a chunk on the
+    other, so this is one UPDATE (and one INSERT) however many pairs there are.
+    """
+    rows = FollowSuggestion.objects.filter(user_id__in=user_ids, candidate_id__in=candidate_ids)
+    rows.update(score=F('score') + delta)
+    if delta > 0:
+        # Pairs that already had a row were just updated and conflict here
+        FollowSuggestion.objects.bulk_create([
+            FollowSuggestion(user_id=user_id, candidate_id=candidate_id, score=delta)
+            for user_id in user_ids for candidate_id in candidate_ids if user_id != candidate_id
+        ], ignore_conflicts=True)
+    else:
+        rows.filter(score__lte=0).delete()
+
+
+def _mutual_count(user_id, candidate_id):
+    return Follow.objects.filter(
+        follower__user_id__in=Follow.objects.following_user_ids(user_id),
+        followed__user_id=candidate_id,
+    ).count()
+
+
+def _update_for_edge(follower_id, followed_id, delta):
+    # The follower now reaches everyone the followed account follows...
+    reachable = Follow.objects.following_user_ids(followed_id).exclude(
+        followed__user_id__in=Follow.objects.following_user_ids(follower_id)
+    )
+    for chunk in _chunks(reachable):
+        _add([follower_id], chunk, delta)
+
+    # ...and everyone following the follower now reaches the followed account
+    audience = Follow.objects.follower_user_ids(follower_id).exclude(
+        follower__user_id__in=Follow.objects.follower_user_ids(followed_id)
+    )
+    for chunk in _chunks(audience):
+        _add(chunk, [followed_id], delta)
+
+
+def record_follow(follower, followed):
+    """Update suggestion scores after follower starts following followed"""
+    FollowSuggestion.objects.filter(user=follower, candidate=followed).delete()
+    _update_for_edge(follower.id, followed.id, 1)
+
+
+def record_unfollow(follower, followed):
+    """Update suggestion scores after follower stops following followed"""
+    _update_for_edge(follower.id, followed.id, -1)
+
+    score = _mutual_count(follower.id, followed.id)
+    if score:
+        FollowSuggestion.objects.update_or_create(
+            user=follower, candidate=followed, defaults={'score': score}
+        )
+
+
+def suggestions_for(user, limit=10):
+    """Candidate user ids, highest mutual count first"""
+    return list(
+        FollowSuggestion.objects.filter(user=user)
+        .order_by('-score', '-candidate_id')
+        .values_list('candidate_id', flat=True)[:limit]
+    )
+
+
+def popular_for(user, exclude_ids, limit=10):
+    """Most-followed accounts the user does not follow, to top up short lists"""
+    return list(
+        Profile.objects.exclude(user_id__in=Follow.objects.following_user_ids(user.id))
+        .exclude(user_id__in=[user.id, *exclude_ids])
+        .order_by('-followers_count')
+        .values_list('user_id', flat=True)[:limit]
+    )
+
+
+def rebuild(user_ids, batch_size=BATCH_SIZE):
+    """Recompute friend-of-friend suggestions from scratch for the given users"""
+    total = 0
+    for chunk in _chunks(user_ids):
+        FollowSuggestion.objects.filter(user_id__in=chunk).delete()
+
+        # Two-hop paths user -> middle -> candidate, counted per (user, candidate)
+        paths = (
+            Follow.objects.filter(follower__follower_edges__follower__user_id__in=chunk)
+            .values(user_id=F('follower__follower_edges__follower__user_id'), candidate_id=F('followed__user_id'))
+            .annotate(score=Count('*'))
+        )
+        followed = {}
+        for user_id, candidate_id in Follow.objects.filter(
+            follower__user_id__in=chunk
+        ).values_list('follower__user_id', 'followed__user_id'):
+            followed.setdefault(user_id, set()).add(candidate_id)
+
+        rows = [
+            FollowSuggestion(user_id=path['user_id'], candidate_id=path['candidate_id'], score=path['score'])
+            for path in paths
+            if path['candidate_id'] != path['user_id']
+            and path['candidate_id'] not in followed.get(path['user_id'], ())
+        ]
+        FollowSuggestion.objects.bulk_create(rows, batch_size=batch_size)
+        total += len(rows)
+    return total
@@ -0,0 +1,42 @@
+"""
+Batched loading of notification targets.
+
+Notifications point at their target through a generic ``target_type`` /
+``target_id`` pair. ``hydrate`` groups a page of notifications by target
+type and loads each group with one query, attaching the object (or None
+when the target has since been deleted) as ``notification.target``.
+"""
+
+
+def _load_posts(ids):
+    from posts.models import Post
+    return Post.objects.only('id', 'author_id', 'image', 'media_variants').in_bulk(ids)
+
+
+# target_type -> function loading {id: object} for a set of ids
+LOADERS = {
+    'post': _load_posts,
+}
+
+
+def hydrate(notifications):
+    """Attach .target to every notification: at most one query per target type"""
+    ids_by_type = {}
+    for notification in notifications:
+        if notification.target_type in LOADERS and notification.target_id is not None:
+            ids_by_type.setdefault(notification.target_type, set()).add(notification.target_id)
+
+    loaded = {
+        target_type: LOADERS[target_type](ids)
+        for target_type, ids in ids_by_type.items()
+    }
+    for notification in notifications:
+        notification.target = loaded.get(notification.target_type, {}).get(notification.target_id)
+    return notifications
+
+
+def target_of(notification):
+    """The notification's target, loading it alone if the list was not hydrated"""
+    if not hasattr(notification, 'target'):
+        hydrate([notification])
+    return notification.target
@@ -1,3 +1,456 @@
-from django.test import TestCase
+import importlib.util
+import shutil
+import unittest
+from io import StringIO
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from posts.models import Post
+from . import badges, membership, notifications, receipts, search, suggestions
+from .middleware import JWTAuthMiddleware
+from .models import Conversation, FollowSuggestion, Message, Notification, NotificationActor
+from .notifications import Event
+from .routing import websocket_urlpatterns
+
+
+def redis_stand_in():
+    """What check_channel_layer can start here: redis-server, fakeredis or nothing"""
+    if shutil.which('redis-server'):
+        return 'redis-server'
+    if importlib.util.find_spec('fakeredis') and importlib.util.find_spec('lupa'):
+        return 'fakeredis'
+    return None
+
+
+@unittest.skipUnless(redis_stand_in(), 'needs redis-server or fakeredis[lua] (requirements-dev.txt)')
+class ChannelLayerTests(SimpleTestCase):
+    def test_group_message_reaches_workers_on_every_shard(self):
+        out = StringIO()
+        call_command(
+            'check_channel_layer', local_redis=2, stand_in=redis_stand_in(),
+            workers=2, timeout=10, stdout=out,
+        )
+        self.assertIn('All 2 workers received the group message', out.getvalue())
+
+
+class NotificationAggregationTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(3)]
+
+    def like(self, *users):
+        notifications.write([Event(self.author.id, user.id, 'like', 'post', 1) for user in users])
+
+    def test_repeat_actor_is_counted_once(self):
+        self.like(self.fans[0])
+        self.like(self.fans[1])
+        self.like(self.fans[0])
+        self.like(self.fans[1], self.fans[1], self.fans[2])
+
+        notification = Notification.objects.get(recipient=self.author, verb='like')
+        self.assertEqual(notification.actors_count, 3)
+        self.assertEqual(notification.actor_id, self.fans[2].id)
+        self.assertEqual(NotificationActor.objects.filter(notification=notification).count(), 3)
+
+    def test_folding_a_batch_into_an_aggregate_takes_constant_queries(self):
+        self.like(self.fans[0])
+        likers = [User.objects.create_user(f'liker{i}') for i in range(28)]
+        with CaptureQueriesContext(connection) as queries:
+            self.like(self.fans[0], *likers)
+        # Savepoint, locking the row, existing actors, one actor INSERT, the
+        # row UPDATEs and the actors pushed; none per liker
+        self.assertLessEqual(len(queries), 8)
+
+        notification = Notification.objects.get(recipient=self.author, verb='like')
+        self.assertEqual(notification.actors_count, 29)
+        self.assertEqual(NotificationActor.objects.filter(notification=notification).count(), 29)
+
+
+class NotificationTargetTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.fan = User.objects.create_user('fan')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def notify_about(self, count):
+        posts = [Post.objects.create(author=self.author, image='posts/p.jpg') for _ in range(count)]
+        notifications.write([Event(self.author.id, self.fan.id, 'mention', 'post', post.id) for post in posts])
+        return posts
+
+    def list_notifications(self):
+        with CaptureQueriesContext(connection) as queries:
+            results = self.client.get('/api/notifications/').json()['results']
+        return results, len(queries)
+
+    def test_targets_are_loaded_in_one_query_and_deleted_ones_flagged(self):
+        self.notify_about(1)
+        _, one_target = self.list_notifications()
+
+        deleted, kept = [post.id for post in self.notify_about(5)][:2]
+        Post.objects.filter(pk=deleted).delete()
+        results, queries = self.list_notifications()
+        self.assertEqual(queries, one_target)
+
+        by_target = {result['target_id']: result for result in results}
+        self.assertFalse(by_target[deleted]['target_exists'])
+        self.assertEqual(by_target[deleted]['renditions']['target_image'], {})
+        self.assertTrue(by_target[kept]['target_exists'])
+        self.assertIn('grid_320', by_target[kept]['renditions']['target_image'])
+
+
+class BadgeTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def badges(self, **headers):
+        return self.client.get('/api/badges/', **headers)
+
+    def test_counters_follow_notifications_and_messages(self):
+        self.assertEqual(self.badges().json(), {'notifications': 0, 'messages': 0})
+
+        notifications.write([Event(self.bob.id, self.alice.id, 'follow', '', None)])
+        Message.objects.create(conversation=self.conversation, sender=self.alice, text='hi')
+        Message.objects.create(conversation=self.conversation, sender=self.alice, text='there')
+        Message.objects.create(conversation=self.conversation, sender=self.bob, text='own')
+        self.assertEqual(self.badges().json(), {'notifications': 1, 'messages': 2})
+
+        self.client.get(f'/api/conversations/{self.conversation.id}/messages/')
+        self.client.patch('/api/notifications/read/')
+        self.assertEqual(self.badges().json(), {'notifications': 0, 'messages': 0})
+
+    def test_unchanged_badges_answer_304_until_a_counter_moves(self):
+        etag = self.badges()['ETag']
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.badges(HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # Served from the cache, without reading the counters
+        self.assertFalse([query for query in queries if 'accounts_profile' in query['sql']])
+
+        Message.objects.create(conversation=self.conversation, sender=self.alice, text='hi')
+        response = self.badges(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['messages'], 1)
+
+    def test_counters_never_drop_below_zero(self):
+        badges.adjust([self.bob.id], notifications=-3, messages=-1)
+        self.assertEqual(self.badges().json(), {'notifications': 0, 'messages': 0})
+
+
+class MembershipTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.carol = User.objects.create_user('carol')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.messages_url = f'/api/conversations/{self.conversation.id}/messages/'
+
+    def get_messages(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        return client.get(self.messages_url)
+
+    def test_participants_are_cached_after_the_first_lookup(self):
+        self.assertEqual(membership.participant_ids(self.conversation.id), {self.alice.id, self.bob.id})
+        with self.assertNumQueries(0):
+            self.assertTrue(membership.is_participant(self.conversation.id, self.alice.id))
+            self.assertFalse(membership.is_participant(self.conversation.id, self.carol.id))
+
+    def test_changes_from_either_side_invalidate_the_cache(self):
+        membership.participant_ids(self.conversation.id)
+        self.conversation.participants.remove(self.bob)
+        self.assertFalse(membership.is_participant(self.conversation.id, self.bob.id))
+
+        self.carol.conversations.add(self.conversation)
+        self.assertTrue(membership.is_participant(self.conversation.id, self.carol.id))
+        self.carol.conversations.clear()
+        self.assertFalse(membership.is_participant(self.conversation.id, self.carol.id))
+
+    def test_non_participants_cannot_read_or_send(self):
+        self.assertEqual(self.get_messages(self.alice).status_code, 200)
+        self.assertEqual(self.get_messages(self.carol).status_code, 403)
+
+        self.conversation.participants.remove(self.bob)
+        self.assertEqual(self.get_messages(self.bob).status_code, 403)
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        self.assertEqual(client.post(self.messages_url, {'text': 'hi'}).status_code, 403)
+
+
+class ReadWatermarkTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.alice, text=f'm{i}') for i in range(3)
+        ]
+
+    def test_watermark_only_moves_forward(self):
+        first, second, third = (message.id for message in self.messages)
+        self.assertEqual(receipts.mark_read(self.conversation.id, self.bob.id, second), second)
+        self.assertIsNone(receipts.mark_read(self.conversation.id, self.bob.id, first))
+        self.assertIsNone(receipts.mark_read(self.conversation.id, self.bob.id, second))
+        self.assertEqual(receipts.mark_read(self.conversation.id, self.bob.id), third)
+        self.assertEqual(receipts.watermarks(self.conversation.id), {self.bob.id: third})
+
+    def test_sender_sees_messages_read_up_to_the_watermark(self):
+        receipts.mark_read(self.conversation.id, self.bob.id, self.messages[1].id)
+        client = APIClient()
+        client.force_authenticate(self.alice)
+        results = client.get(f'/api/conversations/{self.conversation.id}/messages/').json()['results']
+        self.assertEqual(
+            {message['text']: message['is_read'] for message in results},
+            {'m0': True, 'm1': True, 'm2': False},
+        )
+
+
+class InboxTests(TestCase):
+    def setUp(self):
+        self.me = User.objects.create_user('me')
+        self.client = APIClient()
+        self.client.force_authenticate(self.me)
+        self.others = 0
+
+    def start_conversation(self, unread):
+        other = User.objects.create_user(f'other{self.others}')
+        self.others += 1
+        conversation = Conversation.objects.create()
+        conversation.participants.add(self.me, other)
+        url = f'/api/conversations/{conversation.id}/messages/'
+        self.client.post(url, {'text': 'hello'})
+        client = APIClient()
+        client.force_authenticate(other)
+        for i in range(unread):
+            client.post(url, {'text': f'reply {i}'})
+        return conversation
+
+    def inbox(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get('/api/conversations/').json()
+        return data.get('results', data), len(queries)
+
+    def test_inbox_costs_the_same_queries_for_any_number_of_conversations(self):
+        self.start_conversation(unread=1)
+        _, one_conversation = self.inbox()
+
+        for unread in range(2, 6):
+            self.start_conversation(unread)
+        receipts.mark_read(Conversation.objects.latest('id').id, self.me.id)
+        rows, queries = self.inbox()
+        self.assertEqual(queries, one_conversation)
+
+        self.assertEqual([row['unread_count'] for row in rows], [0, 4, 3, 2, 1])
+        self.assertEqual(rows[0]['other_user']['username'], 'other4')
+        self.assertEqual(rows[0]['last_message']['text'], 'reply 4')
+        self.assertEqual(rows[-1]['last_message']['text'], 'reply 0')
+
+
+class SuggestionTests(TestCase):
+    def setUp(self):
+        self.users = {name: User.objects.create_user(name) for name in ('alice', 'bob', 'carol')}
+        self.fans = [User.objects.create_user(f'fan{i}') for i in range(25)]
+
+    def follow(self, follower, followed):
+        client = APIClient()
+        client.force_authenticate(follower)
+        return client.post(f'/api/profile/{followed.username}/follow/')
+
+    def scores(self):
+        return set(FollowSuggestion.objects.values_list('user_id', 'candidate_id', 'score'))
+
+    def test_follow_updates_audience_in_bulk_and_matches_rebuild(self):
+        alice, bob, carol = self.users['alice'], self.users['bob'], self.users['carol']
+        self.follow(bob, carol)
+        for fan in self.fans:
+            self.follow(fan, alice)
+
+        with CaptureQueriesContext(connection) as queries:
+            self.follow(alice, bob)
+        suggestion_writes = [
+            query for query in queries
+            if 'accounts_followsuggestion' in query['sql'] and not query['sql'].startswith('SELECT')
+        ]
+        # Delete (alice, bob), then one UPDATE + INSERT for alice -> carol and for the fans -> bob
+        self.assertLessEqual(len(suggestion_writes), 5)
+        self.assertEqual(FollowSuggestion.objects.filter(candidate=bob).count(), len(self.fans))
+
+        incremental = self.scores()
+        suggestions.rebuild(User.objects.values_list('id', flat=True))
+        self.assertEqual(incremental, self.scores())
+
+        self.follow(alice, bob)
+        self.assertFalse(FollowSuggestion.objects.filter(candidate=bob).exists())
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.users = {
+            name: User.objects.create_user(name, first_name=first_name)
+            for name, first_name in [
+                ('sam', ''), ('samantha', ''), ('bob', 'Sam'), ('user1', ''), ('user4', ''), ('user44', ''),
+            ]
+        }
+
+    def names(self, query):
+        usernames = dict(User.objects.values_list('id', 'username'))
+        return [usernames[user_id] for user_id in search.search(query)]
+
+    def test_exact_username_then_username_prefix_then_name_prefix(self):
+        self.assertEqual(self.names('sam'), ['sam', 'samantha', 'bob'])
+        self.assertEqual(self.names('SAM')[0], 'sam')
+
+    def test_trigram_fallback_finds_substrings(self):
+        self.assertEqual(self.names('mantha'), ['samantha'])
+
+    def test_trigram_fallback_needs_more_than_one_shared_trigram(self):
+        self.assertEqual(sorted(self.names('ser4')), ['user4', 'user44'])
+        self.assertEqual(self.names('zzser'), [])
+
+    def test_endpoint_returns_ranked_users(self):
+        client = APIClient()
+        client.force_authenticate(self.users['bob'])
+        response = client.get('/api/search/', {'q': 'sam', 'typeahead': '1'})
+        self.assertEqual([user['username'] for user in response.json()], ['sam', 'samantha', 'bob'])
+
+
+@override_settings(
+    CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}},
+    BACKGROUND_TASKS_EAGER=True,
+)
+class NotificationConsumerTests(TransactionTestCase):
+    application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user('author')
+        self.fan = User.objects.create_user('fan')
+        self.post = Post.objects.create(author=self.author, image='posts/p.jpg')
+
+    def communicator(self, user=None):
+        path = '/ws/notifications/'
+        if user is not None:
+            path += f'?token={AccessToken.for_user(user)}'
+        return WebsocketCommunicator(self.application, path)
+
+    async def test_anonymous_connection_is_rejected(self):
+        connected, _ = await self.communicator().connect()
+        self.assertFalse(connected)
+
+    async def test_connect_sends_badges_then_pushed_notifications(self):
+        communicator = self.communicator(self.author)
+        connected, _ = await communicator.connect()
+        self.assertTrue(connected)
+        self.assertEqual(
+            await communicator.receive_json_from(),
+            {'type': 'badges', 'badges': {'notifications': 0, 'messages': 0}},
+        )
+
+        await sync_to_async(notifications.write)([Event(self.author.id, self.fan.id, 'like', 'post', self.post.id)])
+
+        frames = [await communicator.receive_json_from(timeout=2) for _ in range(2)]
+        by_type = {frame['type']: frame for frame in frames}
+        self.assertEqual(by_type['badges']['badges']['notifications'], 1)
+        self.assertEqual(by_type['notification']['notification']['actor_username'], 'fan')
+        self.assertEqual(by_type['notification']['notification']['target_id'], self.post.id)
+        await communicator.disconnect()
+
+
+class TypingTests(TransactionTestCase):
+    application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+
+    def communicator(self, user):
+        return WebsocketCommunicator(
+            self.application, f'/ws/chat/{self.conversation.id}/?token={AccessToken.for_user(user)}'
+        )
+
+    async def test_typing_state_is_shared_by_a_users_connections(self):
+        phone, laptop, bob = self.communicator(self.alice), self.communicator(self.alice), self.communicator(self.bob)
+        for communicator in (phone, laptop, bob):
+            await communicator.connect()
+
+        for _ in range(5):
+            await phone.send_json_to({'type': 'typing', 'is_typing': True})
+            await laptop.send_json_to({'type': 'typing', 'is_typing': True})
+        frame = await bob.receive_json_from()
+        self.assertEqual((frame['type'], frame['username'], frame['is_typing']), ('typing', 'alice', True))
+        self.assertTrue(await bob.receive_nothing(0.2))
+
+        await laptop.send_json_to({'type': 'typing', 'is_typing': False})
+        self.assertFalse((await bob.receive_json_from())['is_typing'])
+        for communicator in (phone, laptop, bob):
+            await communicator.disconnect()
+
+
+@override_settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}})
+class ReadReceiptTests(TransactionTestCase):
+    application = JWTAuthMiddleware(URLRouter(websocket_urlpatterns))
+
+    def setUp(self):
+        cache.clear()
+        self.alice = User.objects.create_user('alice')
+        self.bob = User.objects.create_user('bob')
+        self.conversation = Conversation.objects.create()
+        self.conversation.participants.add(self.alice, self.bob)
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, sender=self.alice, text=f'm{i}') for i in range(3)
+        ]
+
+    def communicator(self, user):
+        return WebsocketCommunicator(
+            self.application, f'/ws/chat/{self.conversation.id}/?token={AccessToken.for_user(user)}'
+        )
+
+    async def test_read_frames_broadcast_receipts_only_when_the_watermark_moves(self):
+        alice, bob = self.communicator(self.alice), self.communicator(self.bob)
+        for communicator in (alice, bob):
+            await communicator.connect()
+
+        await bob.send_json_to({'type': 'read', 'message_id': self.messages[1].id})
+        self.assertEqual(
+            await alice.receive_json_from(),
+            {'type': 'read', 'user_id': self.bob.id, 'message_id': self.messages[1].id},
+        )
+        await bob.send_json_to({'type': 'read', 'message_id': self.messages[0].id})
+        self.assertTrue(await alice.receive_nothing(0.2))
+        for communicator in (alice, bob):
+            await communicator.disconnect()
+
+    async def test_fetching_messages_broadcasts_a_receipt(self):
+        alice = self.communicator(self.alice)
+        await alice.connect()
+
+        client = APIClient()
+        client.force_authenticate(self.bob)
+        await sync_to_async(client.get)(f'/api/conversations/{self.conversation.id}/messages/')
+        self.assertEqual(
+            await alice.receive_json_from(),
+            {'type': 'read', 'user_id': self.bob.id, 'message_id': self.messages[-1].id},
+        )
+        await alice.disconnect()
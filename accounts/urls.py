@@ -25,6 +25,7 @@ urlpatterns = [
     # Notifications
     path('notifications/', views.NotificationListView.as_view(), name='notifications'),
     path('notifications/read/', views.mark_notifications_read, name='mark-notifications-read'),
+    path('badges/', views.get_badges, name='badges'),
     
     # Password Reset
     path('password-reset/', views.password_reset_request, name='password-reset-request'),
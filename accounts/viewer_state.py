@@ -0,0 +1,66 @@
+"""
+Relationship state between the requesting user and the objects in a response.
+
+Serializers used to answer ``is_liked`` / ``is_saved`` / ``is_following``
+with one query per object. ``ViewerState`` collects every post and user in
+a response up front and resolves each relationship with a single set-based
+query, so the serializer fields become in-memory set lookups.
+"""
+from posts.models import Post, SavedPost
+from .models import Follow
+
+
+class ViewerState:
+    def __init__(self, user):
+        self.user = user
+        self.liked_post_ids = set()
+        self.saved_post_ids = set()
+        self.following_user_ids = set()
+        self._resolved_post_ids = set()
+        self._resolved_user_ids = set()
+
+    @classmethod
+    def for_context(cls, context):
+        """The viewer state shared by every serializer in this response, if any"""
+        request = context.get('request')
+        if not request or not request.user.is_authenticated:
+            return None
+        if 'viewer_state' not in context:
+            context['viewer_state'] = cls(request.user)
+        return context['viewer_state']
+
+    def resolve(self, post_ids=(), user_ids=()):
+        """Load relationships for ids not seen yet: at most three queries"""
+        post_ids = set(post_ids) - self._resolved_post_ids
+        user_ids = set(user_ids) - self._resolved_user_ids
+
+        if post_ids:
+            self.liked_post_ids.update(
+                Post.likes.through.objects.filter(
+                    user_id=self.user.id, post_id__in=post_ids
+                ).values_list('post_id', flat=True)
+            )
+            self.saved_post_ids.update(
+                SavedPost.objects.filter(
+                    user_id=self.user.id, post_id__in=post_ids
+                ).values_list('post_id', flat=True)
+            )
+            self._resolved_post_ids.update(post_ids)
+
+        if user_ids:
+            self.following_user_ids.update(
+                Follow.objects.following_user_ids(self.user.id).filter(followed__user_id__in=user_ids)
+            )
+            self._resolved_user_ids.update(user_ids)
+
+    def is_liked(self, post):
+        self.resolve(post_ids=[post.id])
+        return post.id in self.liked_post_ids
+
+    def is_saved(self, post):
+        self.resolve(post_ids=[post.id])
+        return post.id in self.saved_post_ids
+
+    def is_following(self, user):
+        self.resolve(user_ids=[user.id])
+        return user.id in self.following_user_ids
@@ -1,5 +1,6 @@
 from rest_framework import generics, status, permissions
 from rest_framework.decorators import api_view, permission_classes, authentication_classes
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from django.views.decorators.csrf import csrf_exempt
@@ -7,11 +8,15 @@ from django.utils.decorators import method_decorator
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
 from django.contrib.auth.tokens import default_token_generator
-from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
+from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode, parse_etags
 from django.utils.encoding import force_bytes, force_str
 from django.core.mail import send_mail
 from django.conf import settings
-from .models import Profile, Notification, Conversation, Message
+from django.db.models import F
+from core.pagination import KeysetPagination
+from posts import timeline
+from . import badges, inbox, membership, notifications, receipts, search, suggestions
+from .models import Profile, Follow, Notification, Conversation, Message
 from .serializers import (
     ProfileSerializer, UserSerializer, NotificationSerializer,
     ConversationSerializer, MessageSerializer, UserRegistrationSerializer
@@ -49,7 +54,7 @@ class ProfileDetailView(generics.RetrieveAPIView):
     lookup_url_kwarg = 'username'
     
     def get_queryset(self):
-        return Profile.objects.select_related('user').prefetch_related('following', 'followers')
+        return Profile.objects.select_related('user')
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -57,6 +62,12 @@ class ProfileDetailView(generics.RetrieveAPIView):
         return context
 
 
+def adjust_follow_counts(follower_profile, followed_profile, delta):
+    """Atomically move the denormalized follow counters on both profiles"""
+    Profile.objects.filter(pk=follower_profile.pk).update(following_count=F('following_count') + delta)
+    Profile.objects.filter(pk=followed_profile.pk).update(followers_count=F('followers_count') + delta)
+
+
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def follow_user(request, username):
@@ -72,8 +83,11 @@ def follow_user(request, username):
     profile = request.user.profile
     target_profile = target_user.profile
     
-    if target_profile in profile.following.all():
-        profile.following.remove(target_profile)
+    unfollowed, _ = Follow.objects.filter(follower=profile, followed=target_profile).delete()
+    if unfollowed:
+        adjust_follow_counts(profile, target_profile, -1)
+        timeline.prune(request.user, target_user)
+        suggestions.record_unfollow(request.user, target_user)
         # Delete follow notification when unfollowing
         Notification.objects.filter(
             recipient=target_user,
@@ -82,13 +96,14 @@ def follow_user(request, username):
         ).delete()
         return Response({'status': 'unfollowed'}, status=status.HTTP_200_OK)
     else:
-        profile.following.add(target_profile)
+        _, created = Follow.objects.get_or_create(follower=profile, followed=target_profile)
+        if not created:
+            return Response({'status': 'followed'}, status=status.HTTP_200_OK)
+        adjust_follow_counts(profile, target_profile, 1)
+        timeline.backfill(request.user, target_user)
+        suggestions.record_follow(request.user, target_user)
         # Create follow notification
-        Notification.objects.create(
-            recipient=target_user,
-            actor=request.user,
-            verb='follow'
-        )
+        notifications.notify(target_user.id, request.user.id, 'follow')
         return Response({'status': 'followed'}, status=status.HTTP_200_OK)
 
 
@@ -108,8 +123,11 @@ def remove_follower(request, username):
     follower_profile = follower_user.profile
     current_profile = request.user.profile
     
-    if current_profile in follower_profile.following.all():
-        follower_profile.following.remove(current_profile)
+    removed, _ = Follow.objects.filter(follower=follower_profile, followed=current_profile).delete()
+    if removed:
+        adjust_follow_counts(follower_profile, current_profile, -1)
+        timeline.prune(follower_user, request.user)
+        suggestions.record_unfollow(follower_user, request.user)
         # Delete follow notification
         Notification.objects.filter(
             recipient=request.user,
@@ -124,22 +142,24 @@ def remove_follower(request, username):
         )
 
 
+def paginated_follow_users(request, edges, user_field):
+    """Page follow edges by follow time (newest first) and serialize the users on one side"""
+    paginator = KeysetPagination()
+    page = paginator.paginate_queryset(edges.select_related(f'{user_field}__user'), request)
+    users = [getattr(edge, user_field).user for edge in page]
+    
+    # Serialize with is_following field for current user
+    serializer = UserSerializer(users, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_followers(request, username):
     """Get list of followers for a user"""
     target_user = get_object_or_404(User, username=username)
-    target_profile = target_user.profile
-    
-    # Get all profiles that are following this user
-    followers = target_profile.followers.all()
-    
-    # Get the User objects from these profiles
-    follower_users = [follower.user for follower in followers]
-    
-    # Serialize with is_following field for current user
-    serializer = UserSerializer(follower_users, many=True, context={'request': request})
-    return Response(serializer.data)
+    edges = Follow.objects.filter(followed__user=target_user)
+    return paginated_follow_users(request, edges, 'follower')
 
 
 @api_view(['GET'])
@@ -147,29 +167,37 @@ def get_followers(request, username):
 def get_following(request, username):
     """Get list of users that this user is following"""
     target_user = get_object_or_404(User, username=username)
-    target_profile = target_user.profile
-    
-    # Get all profiles that this user is following
-    following = target_profile.following.all()
-    
-    # Get the User objects from these profiles
-    following_users = [followed.user for followed in following]
-    
-    # Serialize with is_following field for current user
-    serializer = UserSerializer(following_users, many=True, context={'request': request})
-    return Response(serializer.data)
+    edges = Follow.objects.filter(follower__user=target_user)
+    return paginated_follow_users(request, edges, 'followed')
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def search_users(request):
-    """Search users by username"""
+    """Search users by username, name and bio (pass typeahead=1 for compact results)"""
     query = request.GET.get('q', '')
-    if query:
-        users = User.objects.filter(username__icontains=query)[:20]
-        serializer = UserSerializer(users, many=True, context={'request': request})
-        return Response(serializer.data)
-    return Response([])
+    typeahead = request.GET.get('typeahead') in ('1', 'true')
+    
+    user_ids = search.search(query, limit=8 if typeahead else 20)
+    if not user_ids:
+        return Response([])
+    
+    found = User.objects.select_related('profile').in_bulk(user_ids)
+    users = [found[user_id] for user_id in user_ids if user_id in found]
+    
+    if typeahead:
+        return Response([
+            {
+                'id': user.id,
+                'username': user.username,
+                'full_name': user.get_full_name(),
+                'avatar': user.profile.avatar.url if user.profile.avatar else None,
+            }
+            for user in users
+        ])
+    
+    serializer = UserSerializer(users, many=True, context={'request': request})
+    return Response(serializer.data)
 
 
 @api_view(['GET'])
@@ -177,35 +205,18 @@ def search_users(request):
 def get_suggestions(request):
     """Get user suggestions for people you might want to follow"""
     current_user = request.user
-    current_profile = current_user.profile
     
-    # Get users that the current user is already following
-    following_profiles = current_profile.following.all()
-    following_user_ids = [profile.user.id for profile in following_profiles]
+    # Friends of friends, ranked by mutual follows (precomputed)
+    user_ids = suggestions.suggestions_for(current_user, limit=10)
     
-    # Exclude current user and users already followed
-    exclude_ids = following_user_ids + [current_user.id]
+    # If not enough suggestions, top up with popular accounts
+    if len(user_ids) < 5:
+        user_ids += suggestions.popular_for(current_user, exclude_ids=user_ids, limit=10 - len(user_ids))
     
-    # Get users followed by people you follow (friends of friends)
-    suggested_profiles = Profile.objects.filter(
-        followers__in=following_profiles
-    ).exclude(user__id__in=exclude_ids).distinct()[:10]
+    users = User.objects.select_related('profile').in_bulk(user_ids)
+    ordered = [users[user_id] for user_id in user_ids if user_id in users]
     
-    # If not enough suggestions, get random users
-    if suggested_profiles.count() < 5:
-        additional_users = User.objects.exclude(
-            id__in=exclude_ids
-        ).order_by('?')[:10]
-        
-        # Combine both suggestion lists
-        all_suggestions = list(suggested_profiles.values_list('user', flat=True)) + list(additional_users.values_list('id', flat=True))
-        # Remove duplicates and limit
-        unique_ids = list(dict.fromkeys(all_suggestions))[:10]
-        users = User.objects.filter(id__in=unique_ids)
-    else:
-        users = [profile.user for profile in suggested_profiles]
-    
-    serializer = UserSerializer(users, many=True, context={'request': request})
+    serializer = UserSerializer(ordered, many=True, context={'request': request})
     return Response(serializer.data)
 
 
@@ -213,29 +224,44 @@ class NotificationListView(generics.ListAPIView):
     """List all notifications for current user"""
     serializer_class = NotificationSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
     def get_queryset(self):
-        return Notification.objects.filter(recipient=self.request.user)
+        return Notification.objects.filter(recipient=self.request.user).select_related('actor', 'actor__profile')
 
 
 @api_view(['PATCH'])
 @permission_classes([IsAuthenticated])
 def mark_notifications_read(request):
     """Mark all notifications as read"""
-    Notification.objects.filter(
+    marked = Notification.objects.filter(
         recipient=request.user,
         is_read=False
     ).update(is_read=True)
+    badges.adjust([request.user.id], notifications=-marked)
     return Response({'status': 'success'})
 
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_badges(request):
+    """Unread notification and message counts; answers 304 to a matching If-None-Match"""
+    counts = badges.badges_for(request.user)
+    etag = badges.etag_for(counts)
+    headers = {'ETag': etag, 'Cache-Control': 'private, no-cache'}
+    
+    if etag in parse_etags(request.headers.get('If-None-Match', '')):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(counts, headers=headers)
+
+
 class ConversationListView(generics.ListAPIView):
     """List all conversations for current user"""
     serializer_class = ConversationSerializer
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Conversation.objects.filter(participants=self.request.user)
+        return inbox.conversations_for(self.request.user)
     
     def get_serializer_context(self):
         return {'request': self.request}
@@ -247,7 +273,7 @@ class ConversationDetailView(generics.RetrieveAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        return Conversation.objects.filter(participants=self.request.user)
+        return inbox.conversations_for(self.request.user)
     
     def get_serializer_context(self):
         return {'request': self.request}
@@ -257,38 +283,46 @@ class MessageListView(generics.ListCreateAPIView):
     """List messages in a conversation and create new messages"""
     serializer_class = MessageSerializer
     permission_classes = [IsAuthenticated]
+    pagination_class = KeysetPagination
     
-    def get_queryset(self):
+    def get_conversation_id(self):
+        """The conversation in the URL, if the user takes part in it"""
         conversation_id = self.kwargs.get('conversation_id')
-        return Message.objects.filter(conversation_id=conversation_id)
+        if not membership.is_participant(conversation_id, self.request.user.id):
+            raise PermissionDenied('You are not a participant in this conversation')
+        return conversation_id
+    
+    def get_queryset(self):
+        return Message.objects.filter(
+            conversation_id=self.get_conversation_id()
+        ).select_related('sender', 'sender__profile')
     
     def list(self, request, *args, **kwargs):
-        """Override list to mark messages as read when fetched"""
-        response = super().list(request, *args, **kwargs)
+        """Override list to mark the conversation read when fetched"""
+        conversation_id = self.get_conversation_id()
         
-        # Mark all unread messages in this conversation as read
-        conversation_id = self.kwargs.get('conversation_id')
-        Message.objects.filter(
-            conversation_id=conversation_id,
-            is_read=False
-        ).exclude(sender=request.user).update(is_read=True)
+        # Move the reader's watermark to the latest message and tell the sender
+        watermark = receipts.mark_read(conversation_id, request.user.id)
+        if watermark is not None:
+            receipts.broadcast(conversation_id, request.user.id, watermark)
+        self.read_watermarks = receipts.watermarks(conversation_id)
         
-        return response
+        return super().list(request, *args, **kwargs)
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if hasattr(self, 'read_watermarks'):
+            context['read_watermarks'] = self.read_watermarks
+        return context
     
     def perform_create(self, serializer):
-        conversation_id = self.kwargs.get('conversation_id')
-        conversation = get_object_or_404(Conversation, id=conversation_id)
-        
-        # Check if user is participant
-        if self.request.user not in conversation.participants.all():
-            return Response(
-                {'error': 'You are not a participant in this conversation'},
-                status=status.HTTP_403_FORBIDDEN
-            )
-        
-        serializer.save(
+        conversation_id = self.get_conversation_id()
+        message = serializer.save(
             sender=self.request.user,
-            conversation=conversation
+            conversation_id=conversation_id
+        )
+        Conversation.objects.filter(id=conversation_id).update(
+            updated_at=message.created_at, last_message=message
         )
 
 
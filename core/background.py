@@ -0,0 +1,71 @@
+"""
+Deferred work that should not hold up a response.
+
+``defer`` schedules a function to run once the current transaction
+commits, on a small in-process thread pool, so it sees the committed rows
+and a rolled-back request never triggers it. Set BACKGROUND_TASKS_EAGER to
+run deferred work inline instead (useful in tests and management shells).
+
+Slow jobs such as media processing go to their own pool (``defer_to``) so
+they cannot hold up notifications and other quick work queued behind them.
+"""
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+
+logger = logging.getLogger(__name__)
+
+# pool name -> setting holding its number of threads
+POOLS = {
+    'default': 'BACKGROUND_WORKERS',
+    'media': 'BACKGROUND_MEDIA_WORKERS',
+}
+
+_executors = {}
+_lock = threading.Lock()
+
+
+def _get_executor(pool):
+    with _lock:
+        if pool not in _executors:
+            _executors[pool] = ThreadPoolExecutor(
+                max_workers=getattr(settings, POOLS[pool], 1),
+                thread_name_prefix=f'background-{pool}',
+            )
+        return _executors[pool]
+
+
+def _run(func, args, kwargs):
+    close_old_connections()
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception('Background task %s failed', getattr(func, '__name__', func))
+    finally:
+        close_old_connections()
+
+
+def submit_to(pool, func, *args, **kwargs):
+    """Run func(*args, **kwargs) on the named pool now, regardless of any transaction"""
+    if getattr(settings, 'BACKGROUND_TASKS_EAGER', False):
+        func(*args, **kwargs)
+    else:
+        _get_executor(pool).submit(_run, func, args, kwargs)
+
+
+def submit(func, *args, **kwargs):
+    submit_to('default', func, *args, **kwargs)
+
+
+def defer_to(pool, func, *args, **kwargs):
+    """Run func(*args, **kwargs) on the named pool after the transaction commits"""
+    transaction.on_commit(lambda: submit_to(pool, func, *args, **kwargs))
+
+
+def defer(func, *args, **kwargs):
+    """Run func(*args, **kwargs) off the request thread after the transaction commits"""
+    defer_to('default', func, *args, **kwargs)
@@ -0,0 +1,133 @@
+"""
+Image derivatives for uploaded media.
+
+``make_variants`` decodes an image once and writes a downscaled JPEG and
+WebP for every width in VARIANT_WIDTHS (never upscaling) under
+``variants/`` in storage. Width renditions of post and story images
+(``core.renditions``) are served from these files. ``poster_frame`` grabs the first frame of a
+video with ffmpeg when it is installed, so videos get the same variants.
+Both are slow, so callers run them on the background pool, never inside
+a request.
+"""
+import logging
+import os
+import shutil
+import subprocess
+import tempfile
+from io import BytesIO
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+
+logger = logging.getLogger(__name__)
+
+VARIANT_WIDTHS = (320, 640, 1080)
+
+# format -> (Pillow format, file extension, save options)
+FORMATS = {
+    'jpeg': ('JPEG', 'jpg', {'quality': 82, 'optimize': True, 'progressive': True}),
+    'webp': ('WEBP', 'webp', {'quality': 80, 'method': 4}),
+}
+
+VARIANTS_DIR = 'variants'
+
+
+def open_image(source):
+    """Decode an image upright and in RGB, ready to be resized and re-encoded"""
+    image = ImageOps.exif_transpose(Image.open(source))
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return image
+
+
+def resize_to_width(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def encode(image, fmt):
+    pil_format, _, options = FORMATS[fmt]
+    buffer = BytesIO()
+    image.save(buffer, pil_format, **options)
+    return ContentFile(buffer.getvalue())
+
+
+def derived_name(original_name, label, fmt):
+    """
+    variants/<original name>/<label>.<ext>. The original name is kept whole
+    (extension included), so a.jpg and a.png never share a variant name.
+    """
+    return f'{VARIANTS_DIR}/{original_name}/{label}.{FORMATS[fmt][1]}'
+
+
+def target_widths(image, widths=VARIANT_WIDTHS):
+    """
+    Every width up to the first one the image fits in. That last variant
+    keeps the image's own size (nothing is upscaled) but is still stored
+    under its width, so every width rendition has a variant to serve.
+    """
+    targets = []
+    for width in sorted(widths):
+        targets.append(width)
+        if width >= image.width:
+            break
+    return targets
+
+
+def make_variants(image, original_name, widths=VARIANT_WIDTHS):
+    """Write every variant and return {format: {width: storage name}}"""
+    variants = {fmt: {} for fmt in FORMATS}
+    for width in target_widths(image, widths):
+        resized = resize_to_width(image, width)
+        for fmt in FORMATS:
+            name = derived_name(original_name, width, fmt)
+            variants[fmt][str(width)] = default_storage.save(name, encode(resized, fmt))
+    return variants
+
+
+def poster_frame(video_name):
+    """The first frame of a stored video as an image, or None without ffmpeg"""
+    binary = shutil.which('ffmpeg')
+    if binary is None:
+        return None
+
+    _, extension = os.path.splitext(video_name)
+    with default_storage.open(video_name) as source, tempfile.NamedTemporaryFile(suffix=extension) as local:
+        shutil.copyfileobj(source, local)
+        local.flush()
+        try:
+            result = subprocess.run(
+                [binary, '-v', 'error', '-i', local.name, '-frames:v', '1',
+                 '-f', 'image2pipe', '-vcodec', 'png', '-'],
+                capture_output=True, timeout=60, check=True,
+            )
+        except (subprocess.SubprocessError, OSError):
+            logger.warning('Could not extract a poster frame from %s', video_name)
+            return None
+    return open_image(BytesIO(result.stdout))
+
+
+def variant_names(variants):
+    """Every storage name in a variants map (for deleting them with the original)"""
+    names = []
+    for value in (variants or {}).values():
+        if isinstance(value, dict):
+            names.extend(value.values())
+        elif value:
+            names.append(value)
+    return names
+
+
+def variant_urls(variants):
+    """The variants map with storage names replaced by URLs"""
+    urls = {}
+    for key, value in (variants or {}).items():
+        if isinstance(value, dict):
+            urls[key] = {width: default_storage.url(name) for width, name in value.items()}
+        else:
+            urls[key] = default_storage.url(value)
+    return urls
@@ -1,3 +1,15 @@
-from django.db import models
+class DerivedFieldsMixin:
+    """
+    For models whose DERIVED_FIELDS (denormalized counters, worker output)
+    only change through queryset updates. Saving an existing instance writes
+    every other field, so a stale in-memory copy never overwrites them.
+    """
+    DERIVED_FIELDS = ()
 
-# Create your models here.
+    def save(self, *args, **kwargs):
+        if not self._state.adding and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.DERIVED_FIELDS
+            ]
+        super().save(*args, **kwargs)
@@ -0,0 +1,161 @@
+"""
+Named-size renditions of uploaded images.
+
+Serializers return a compact map of rendition URLs next to each original,
+for example ``{'avatar_64': url}`` for an avatar in a comment list or
+``{'grid_320': url, 'feed_1080': url}`` for a post image. Renditions that
+only set a width match one of imaging.VARIANT_WIDTHS, so once the media
+worker has stored the variants of a post or story image, their names
+(from its ``media_variants`` map) are carried in the URL and served as
+they are. Anything else (avatars, or uploads whose variants are not ready
+yet) is generated on first request: the original is decoded, resized and
+cached under ``renditions/`` in storage, and later requests serve that
+file. URLs carry a signature of the rendition, original name and variant
+names, so only renditions we handed out can be generated or served.
+Stored names never change content, so the responses are served as
+immutable.
+"""
+import os
+import tempfile
+from urllib.parse import urlencode
+
+from django.core.files.storage import default_storage
+from django.urls import reverse
+from django.utils.crypto import salted_hmac
+from PIL import Image, ImageOps
+
+from . import imaging
+
+
+# name -> (width, height); a height of None keeps the aspect ratio, and
+# those widths are among imaging.VARIANT_WIDTHS so stored variants are served
+RENDITIONS = {
+    'avatar_64': (64, 64),
+    'avatar_150': (150, 150),
+    'grid_320': (320, None),
+    'feed_1080': (1080, None),
+}
+
+# Renditions offered for each kind of image
+AVATAR = ('avatar_64',)
+PROFILE_AVATAR = ('avatar_64', 'avatar_150')
+POST_IMAGE = ('grid_320', 'feed_1080')
+STORY_IMAGE = ('feed_1080',)
+NOTIFICATION_TARGET = ('grid_320',)
+
+RENDITIONS_DIR = 'renditions'
+
+
+def token(rendition, name, variants=None):
+    signed = f'{rendition}:{name}'
+    for fmt, variant in sorted((variants or {}).items()):
+        signed += f':{fmt}={variant}'
+    return salted_hmac('core.renditions', signed).hexdigest()[:16]
+
+
+def url(name, rendition, variants=None):
+    """
+    URL of a rendition. variants maps formats to stored variant names that
+    already match it; they are passed (and signed) in the query string.
+    """
+    path = reverse('rendition', kwargs={
+        'rendition': rendition, 'token': token(rendition, name, variants), 'name': name,
+    })
+    return f'{path}?{urlencode(sorted(variants.items()))}' if variants else path
+
+
+def matching_variants(rendition, variants):
+    """{format: storage name} of the stored variants that match a width-only rendition"""
+    width, height = RENDITIONS[rendition]
+    if height is not None or not variants:
+        return {}
+    return {
+        fmt: variants[fmt][str(width)]
+        for fmt in imaging.FORMATS if str(width) in variants.get(fmt, {})
+    }
+
+
+def urls_for(field_file, renditions, variants=None):
+    """{rendition: url} for a stored file, or {} when there is none"""
+    if not field_file:
+        return {}
+    return {
+        rendition: url(field_file.name, rendition, matching_variants(rendition, variants))
+        for rendition in renditions
+    }
+
+
+def avatar_urls(user, renditions=AVATAR):
+    """Avatar renditions of a user, or {} without a profile or avatar"""
+    profile = getattr(user, 'profile', None)
+    return urls_for(profile.avatar if profile else None, renditions)
+
+
+def cached_name(rendition, name, fmt):
+    """renditions/<rendition>/<original name>.<ext>, extension of the original included"""
+    return f'{RENDITIONS_DIR}/{rendition}/{name}.{imaging.FORMATS[fmt][1]}'
+
+
+def cached_names(name):
+    """Every rendition that may have been cached for an original (for deleting them with it)"""
+    if not name:
+        return []
+    return [cached_name(rendition, name, fmt) for rendition in RENDITIONS for fmt in imaging.FORMATS]
+
+
+def resize(image, rendition):
+    width, height = RENDITIONS[rendition]
+    if height is None:
+        return imaging.resize_to_width(image, width)
+    # Center crop to the target shape, without upscaling small originals
+    scale = min(1, image.width / width, image.height / height)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return ImageOps.fit(image, size, Image.LANCZOS)
+
+
+def render(rendition, name, fmt, variant=None):
+    """
+    Storage name of the stored variant or cached rendition, generating it on
+    first use. A variant that has since been replaced (by a rebuild) falls
+    back to a rendition of the original.
+    """
+    if variant and default_storage.exists(variant):
+        return variant
+    cached = cached_name(rendition, name, fmt)
+    if default_storage.exists(cached):
+        return cached
+
+    with default_storage.open(name) as source:
+        image = imaging.open_image(source)
+    _write(cached, imaging.encode(resize(image, rendition), fmt))
+    return cached
+
+
+def _write(name, content):
+    """
+    Store content under name so a concurrent request never serves (with
+    immutable headers) a file that is still being written. Storages with
+    local paths get a temporary file renamed into place; others (object
+    stores) publish an upload only once it is complete. Concurrent renders
+    of the same rendition produce identical bytes, so whichever lands
+    first is kept.
+    """
+    try:
+        path = default_storage.path(name)
+    except NotImplementedError:
+        saved = default_storage.save(name, content)
+        if saved != name:
+            default_storage.delete(saved)
+        return
+
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, temporary = tempfile.mkstemp(dir=directory, suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as target:
+            target.write(content.read())
+        os.chmod(temporary, default_storage.file_permissions_mode or 0o644)
+        os.replace(temporary, path)
+    except BaseException:
+        os.unlink(temporary)
+        raise
@@ -0,0 +1,54 @@
+from django.db import models
+from rest_framework import serializers
+
+from . import imaging
+
+
+class SparseFieldsetMixin:
+    """
+    Lets clients trim a response with ``?fields=id,image,likes_count``.
+
+    Only the top-level objects of a response are trimmed; nested
+    serializers keep their full shape.
+    """
+    fields_query_param = 'fields'
+
+    def get_fields(self):
+        fields = super().get_fields()
+        request = self.context.get('request')
+        if request is None or not self.is_top_level():
+            return fields
+
+        requested = request.query_params.get(self.fields_query_param)
+        if not requested:
+            return fields
+        allowed = {name.strip() for name in requested.split(',')}
+        return {name: field for name, field in fields.items() if name in allowed}
+
+    def is_top_level(self):
+        if self.parent is None:
+            return True
+        return isinstance(self.parent, serializers.ListSerializer) and self.parent.parent is None
+
+
+class BatchedListSerializer(serializers.ListSerializer):
+    """
+    Hands the whole list to ``prepare`` before any item is serialized, so a
+    subclass can load what every item needs (viewer state, related rows)
+    with one query instead of one per item.
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if isinstance(data, models.manager.BaseManager) else data)
+        self.prepare(items)
+        return super().to_representation(items)
+
+    def prepare(self, items):
+        pass
+
+
+class MediaVariantsField(serializers.ReadOnlyField):
+    """A ``media_variants`` map with storage names turned into URLs (empty until processed)"""
+
+    def to_representation(self, value):
+        return imaging.variant_urls(value)
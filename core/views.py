@@ -1,3 +1,33 @@
-from django.shortcuts import render
+from django.core.files.storage import default_storage
+from django.http import FileResponse, Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.crypto import constant_time_compare
+from django.views.decorators.http import require_GET
+from PIL import Image
 
-# Create your views here.
+from . import imaging, renditions
+
+
+# Rendition URLs never change content, so clients and CDNs may keep them for a year
+IMMUTABLE = 'public, max-age=31536000, immutable'
+
+
+@require_GET
+def rendition(request, rendition, token, name):
+    """Serve a named rendition of a stored image, generating and caching it on first use"""
+    if rendition not in renditions.RENDITIONS:
+        raise Http404
+    variants = {fmt: request.GET[fmt] for fmt in imaging.FORMATS if fmt in request.GET}
+    if not constant_time_compare(token, renditions.token(rendition, name, variants)):
+        raise Http404
+
+    fmt = 'webp' if 'image/webp' in request.headers.get('Accept', '') else 'jpeg'
+    try:
+        cached = renditions.render(rendition, name, fmt, variants.get(fmt))
+    except (OSError, ValueError, Image.DecompressionBombError):
+        raise Http404
+
+    response = FileResponse(default_storage.open(cached), content_type=f'image/{fmt}')
+    response['Cache-Control'] = IMMUTABLE
+    patch_vary_headers(response, ['Accept'])
+    return response
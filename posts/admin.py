@@ -1,5 +1,8 @@
 from django.contrib import admin
-from .models import Post, Comment, Story, StoryView, SavedPost
+from .models import (
+    Post, Comment, Story, StoryView, SavedPost, TimelineEntry, ExploreCandidate,
+    Hashtag, PostHashtag, HashtagTrend, Mention,
+)
 
 
 @admin.register(Post)
@@ -19,7 +22,7 @@ class CommentAdmin(admin.ModelAdmin):
 
 @admin.register(Story)
 class StoryAdmin(admin.ModelAdmin):
-    list_display = ('user', 'created_at', 'expires_at', 'is_active')
+    list_display = ('user', 'created_at', 'expires_at', 'is_active', 'views_count')
     list_filter = ('created_at',)
     search_fields = ('user__username',)
 
@@ -36,3 +39,43 @@ class SavedPostAdmin(admin.ModelAdmin):
     list_display = ('user', 'post', 'saved_at')
     list_filter = ('saved_at',)
     search_fields = ('user__username', 'post__id')
+
+
+@admin.register(TimelineEntry)
+class TimelineEntryAdmin(admin.ModelAdmin):
+    list_display = ('user', 'post', 'author', 'created_at')
+    search_fields = ('user__username', 'author__username')
+    raw_id_fields = ('user', 'post', 'author')
+
+
+@admin.register(ExploreCandidate)
+class ExploreCandidateAdmin(admin.ModelAdmin):
+    list_display = ('post', 'author', 'score', 'refreshed_at')
+    search_fields = ('author__username',)
+    raw_id_fields = ('post', 'author')
+
+
+@admin.register(Hashtag)
+class HashtagAdmin(admin.ModelAdmin):
+    list_display = ('name', 'posts_count', 'created_at')
+    search_fields = ('name',)
+
+
+@admin.register(PostHashtag)
+class PostHashtagAdmin(admin.ModelAdmin):
+    list_display = ('hashtag', 'post', 'created_at')
+    raw_id_fields = ('hashtag', 'post')
+
+
+@admin.register(HashtagTrend)
+class HashtagTrendAdmin(admin.ModelAdmin):
+    list_display = ('hashtag', 'bucket', 'uses')
+    list_filter = ('bucket',)
+    raw_id_fields = ('hashtag',)
+
+
+@admin.register(Mention)
+class MentionAdmin(admin.ModelAdmin):
+    list_display = ('author', 'user', 'post', 'comment', 'created_at')
+    search_fields = ('author__username', 'user__username')
+    raw_id_fields = ('post', 'comment', 'user', 'author')
@@ -0,0 +1,105 @@
+"""
+Precomputed explore ranking.
+
+Every recent post has an ``ExploreCandidate`` row whose score combines
+engagement with recency::
+
+    score = log2(1 + likes + 2 * comments + 3 * saves) + age_bonus
+
+where ``age_bonus`` grows by one per HALF_LIFE since an arbitrary epoch.
+Doubling a post's engagement is worth exactly one half-life of recency,
+which gives the same ordering as decaying every score over time but never
+needs rewriting rows just because the clock moved. Scores are refreshed
+incrementally from like, comment and save events, and the
+``refresh_explore`` command rebuilds the pool and drops posts that have
+aged out of WINDOW.
+"""
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.utils import timezone
+
+from core.pagination import KeysetPagination
+from accounts.models import Follow
+from .models import ExploreCandidate, Post
+
+
+HALF_LIFE = timedelta(hours=24)
+WINDOW = timedelta(days=30)
+
+LIKE_WEIGHT = 1
+COMMENT_WEIGHT = 2
+SAVE_WEIGHT = 3
+
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def hot_score(likes, comments, saves, created_at):
+    engagement = LIKE_WEIGHT * likes + COMMENT_WEIGHT * comments + SAVE_WEIGHT * saves
+    age_bonus = (created_at - EPOCH) / HALF_LIFE
+    return math.log2(1 + engagement) + age_bonus
+
+
+def refresh_post(post_id):
+    """Recompute one post's score after an engagement event"""
+    row = Post.objects.filter(pk=post_id).values(
+        'author_id', 'likes_count', 'comments_count', 'saves_count', 'created_at'
+    ).first()
+    if row is None or row['created_at'] < timezone.now() - WINDOW:
+        return
+
+    ExploreCandidate.objects.update_or_create(
+        post_id=post_id,
+        defaults={
+            'author_id': row['author_id'],
+            'score': hot_score(row['likes_count'], row['comments_count'], row['saves_count'], row['created_at']),
+        },
+    )
+
+
+def rebuild(batch_size=1000):
+    """Score every post inside the window and drop candidates that aged out"""
+    cutoff = timezone.now() - WINDOW
+    ExploreCandidate.objects.filter(post__created_at__lt=cutoff).delete()
+
+    posts = Post.objects.filter(created_at__gte=cutoff).values_list(
+        'id', 'author_id', 'likes_count', 'comments_count', 'saves_count', 'created_at'
+    )
+    batch = []
+    total = 0
+    for post_id, author_id, likes, comments, saves, created_at in posts.iterator(chunk_size=batch_size):
+        batch.append(ExploreCandidate(
+            post_id=post_id,
+            author_id=author_id,
+            score=hot_score(likes, comments, saves, created_at),
+        ))
+        if len(batch) >= batch_size:
+            total += _write(batch)
+            batch = []
+    if batch:
+        total += _write(batch)
+    return total
+
+
+def _write(candidates):
+    ExploreCandidate.objects.bulk_create(
+        candidates,
+        update_conflicts=True,
+        unique_fields=['post'],
+        update_fields=['author', 'score', 'refreshed_at'],
+    )
+    return len(candidates)
+
+
+def candidates_for(user):
+    """The ranked pool, without the viewer's own posts or accounts they follow"""
+    candidates = ExploreCandidate.objects.all()
+    if user.is_authenticated:
+        followed = Follow.objects.following_user_ids(user.id)
+        candidates = candidates.exclude(author_id=user.id).exclude(author_id__in=followed)
+    return candidates
+
+
+class ExplorePagination(KeysetPagination):
+    page_size = 20
+    ordering = ('-score', '-post_id')
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts import stories
+
+
+class Command(BaseCommand):
+    help = 'Delete expired stories with their views and media files, in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=stories.BATCH_SIZE)
+        parser.add_argument('--every', type=int, default=0, metavar='SECONDS',
+                            help='Keep running and sweep again every SECONDS')
+
+    def handle(self, *args, **options):
+        while True:
+            deleted, views, files = stories.expire(batch_size=options['batch_size'])
+            self.stdout.write(self.style.SUCCESS(
+                f'Deleted {deleted} expired stories, {views} story views and {files} media files'
+            ))
+            if not options['every']:
+                break
+            time.sleep(options['every'])
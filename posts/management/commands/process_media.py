@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand
+
+from posts import media
+from posts.models import Post, Story
+
+
+class Command(BaseCommand):
+    help = 'Build resized media variants for posts and stories that do not have them yet (or all with --all)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', help='Rebuild variants that already exist too')
+
+    def handle(self, *args, **options):
+        for model in (Post, Story):
+            queryset = model.objects.exclude(image='', video='').exclude(image=None, video=None)
+            if not options['all']:
+                queryset = queryset.filter(media_variants={})
+
+            total = 0
+            for pk in queryset.order_by('pk').values_list('pk', flat=True).iterator():
+                media.process(model, pk)
+                total += 1
+            self.stdout.write(self.style.SUCCESS(f'Processed media for {total} {model._meta.verbose_name_plural}'))
@@ -0,0 +1,81 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, F, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
+
+from accounts.models import ConversationRead, Follow, Message, Notification, Profile
+from posts.models import Comment, Hashtag, Post, PostHashtag, SavedPost, Story, StoryView
+
+
+def count_of(queryset, field):
+    """Correlated COUNT(*) of ``queryset`` rows whose ``field`` points at the outer row"""
+    rows = queryset.filter(**{field: OuterRef('pk')}).order_by().values(field)
+    return Coalesce(Subquery(rows.annotate(total=Count('*')).values('total')), 0)
+
+
+def unread_messages():
+    """Messages above the outer profile's read watermark in each conversation, sent by others"""
+    watermark = ConversationRead.objects.filter(
+        conversation=OuterRef('conversation'), user__profile=OuterRef(OuterRef('pk'))
+    ).values('last_read_message_id')[:1]
+    return Message.objects.exclude(sender__profile=OuterRef('pk')).filter(
+        id__gt=Coalesce(Subquery(watermark), 0)
+    )
+
+
+class Command(BaseCommand):
+    help = 'Recompute denormalized like, comment, save, post, follow, unread, hashtag and story view counters that have drifted'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        follows = Follow.objects.all()
+
+        fixed_posts = self.reconcile(Post.objects.all(), {
+            'likes_count': count_of(Post.likes.through.objects.all(), 'post'),
+            'comments_count': count_of(Comment.objects.all(), 'post'),
+            'saves_count': count_of(SavedPost.objects.all(), 'post'),
+        }, batch_size)
+        fixed_profiles = self.reconcile(Profile.objects.all(), {
+            'posts_count': count_of(Post.objects.all(), 'author__profile'),
+            'followers_count': count_of(follows, 'followed'),
+            'following_count': count_of(follows, 'follower'),
+            'unread_notifications_count': count_of(Notification.objects.filter(is_read=False), 'recipient__profile'),
+            'unread_messages_count': count_of(unread_messages(), 'conversation__participants__profile'),
+        }, batch_size)
+        fixed_hashtags = self.reconcile(Hashtag.objects.all(), {
+            'posts_count': count_of(PostHashtag.objects.all(), 'hashtag'),
+        }, batch_size)
+        fixed_stories = self.reconcile(Story.objects.all(), {
+            'views_count': count_of(StoryView.objects.all(), 'story'),
+        }, batch_size)
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Reconciled {fixed_posts} posts, {fixed_profiles} profiles, '
+            f'{fixed_hashtags} hashtags and {fixed_stories} stories'
+        ))
+
+    def reconcile(self, queryset, counters, batch_size):
+        """Walk the table in primary key batches and rewrite only drifted rows"""
+        actual = {f'actual_{name}': expression for name, expression in counters.items()}
+        drifted = Q()
+        for name in counters:
+            drifted |= ~Q(**{name: F(f'actual_{name}')})
+
+        fixed = 0
+        last_pk = 0
+        while True:
+            pks = list(
+                queryset.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not pks:
+                return fixed
+            last_pk = pks[-1]
+
+            rows = list(queryset.filter(pk__in=pks).annotate(**actual).filter(drifted))
+            for row in rows:
+                for name in counters:
+                    setattr(row, name, getattr(row, f'actual_{name}'))
+            queryset.model.objects.bulk_update(rows, list(counters))
+            fixed += len(rows)
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from posts import explore
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the explore candidate pool and drop posts older than the ranking window'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        total = explore.rebuild(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Ranked {total} explore candidates'))
@@ -0,0 +1,87 @@
+"""
+Derivative generation for post and story uploads.
+
+Uploads are stored exactly as received and the request returns straight
+away. ``queue`` schedules ``process`` on the media pool once the new
+row has committed. It cuts JPEG/WebP variants from the image, or from a
+poster frame for videos, and stores their names in ``media_variants``:
+
+    {'jpeg': {'320': name, ...}, 'webp': {'320': name, ...}, 'poster': name}
+
+Deleting a post or story removes these with the original (``stored_names``
+and ``remove_files``), along with any renditions cached for it.
+"""
+import logging
+
+from django.core.files.storage import default_storage
+from PIL import Image
+
+from core import imaging, renditions
+from core.background import defer_to
+
+
+logger = logging.getLogger(__name__)
+
+
+def queue(instance):
+    """Generate variants for a new post or story after the request commits"""
+    if instance.image or instance.video:
+        defer_to('media', process, type(instance), instance.pk)
+
+
+def variants_for(instance):
+    if instance.image:
+        with instance.image.open('rb') as source:
+            image = imaging.open_image(source)
+        return imaging.make_variants(image, instance.image.name)
+
+    if instance.video:
+        frame = imaging.poster_frame(instance.video.name)
+        if frame is None:
+            return {}
+        poster = imaging.resize_to_width(frame, max(imaging.VARIANT_WIDTHS))
+        variants = imaging.make_variants(frame, instance.video.name)
+        variants['poster'] = default_storage.save(
+            imaging.derived_name(instance.video.name, 'poster', 'jpeg'), imaging.encode(poster, 'jpeg')
+        )
+        return variants
+
+    return {}
+
+
+def process(model, pk):
+    """Build and store the variants of one post or story"""
+    instance = model.objects.filter(pk=pk).only('image', 'video', 'media_variants').first()
+    if instance is None:
+        return
+    try:
+        variants = variants_for(instance)
+    except (OSError, ValueError, Image.DecompressionBombError):
+        logger.warning('Could not build media variants for %s %s', model.__name__, pk)
+        return
+    if model.objects.filter(pk=pk).update(media_variants=variants):
+        # Rebuilt: the previous variants are no longer referenced
+        stale = imaging.variant_names(instance.media_variants)
+    else:
+        # Deleted while we were working: drop the files we just wrote
+        stale = imaging.variant_names(variants)
+    for name in stale:
+        default_storage.delete(name)
+
+
+def upload_names(image, video, variants):
+    """The uploaded files and their variants"""
+    return [name for name in (image, video, *imaging.variant_names(variants)) if name]
+
+
+def stored_names(image, video, variants):
+    """The uploaded files and every derivative stored for them, cached renditions included"""
+    return upload_names(image, video, variants) + renditions.cached_names(image)
+
+
+def remove_files(names):
+    for name in names:
+        try:
+            default_storage.delete(name)
+        except OSError:
+            pass
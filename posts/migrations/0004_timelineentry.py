@@ -0,0 +1,49 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def backfill_timelines(apps, schema_editor):
+    """Materialize timelines for existing follow relationships"""
+    Post = apps.get_model('posts', 'Post')
+    Profile = apps.get_model('accounts', 'Profile')
+    TimelineEntry = apps.get_model('posts', 'TimelineEntry')
+    
+    edges = Profile.following.through.objects.values_list('from_profile__user_id', 'to_profile__user_id')
+    for follower_id, author_id in edges.iterator():
+        posts = Post.objects.filter(author_id=author_id).order_by('-created_at').values_list('id', 'created_at')[:200]
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=follower_id, post_id=post_id, author_id=author_id, created_at=created_at)
+            for post_id, created_at in posts
+        ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('accounts', '0003_alter_profile_avatar'),
+        ('posts', '0003_post_video_alter_post_image'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='posts.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name_plural': 'Timeline entries',
+                'ordering': ['-created_at', '-post'],
+                'indexes': [models.Index(fields=['user', '-created_at', '-post'], name='posts_timeline_user_idx'), models.Index(fields=['user', 'author'], name='posts_timeline_author_idx')],
+                'unique_together': {('user', 'post')},
+            },
+        ),
+        migrations.RunPython(backfill_timelines, migrations.RunPython.noop),
+    ]
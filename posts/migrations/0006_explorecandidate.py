@@ -0,0 +1,73 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:18
+
+import math
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+
+# Frozen copy of posts.explore as of this migration, so later changes to
+# the ranking cannot change what this migration does
+HALF_LIFE = timedelta(hours=24)
+WINDOW = timedelta(days=30)
+EPOCH = datetime(2025, 1, 1, tzinfo=dt_timezone.utc)
+
+
+def hot_score(likes, comments, saves, created_at):
+    engagement = likes + 2 * comments + 3 * saves
+    age_bonus = (created_at - EPOCH) / HALF_LIFE
+    return math.log2(1 + engagement) + age_bonus
+
+
+def populate_explore(apps, schema_editor):
+    Post = apps.get_model('posts', 'Post')
+    SavedPost = apps.get_model('posts', 'SavedPost')
+    ExploreCandidate = apps.get_model('posts', 'ExploreCandidate')
+    
+    saves = SavedPost.objects.filter(post=OuterRef('pk')).order_by().values('post')
+    Post.objects.update(saves_count=Coalesce(Subquery(saves.annotate(total=Count('*')).values('total')), 0))
+    
+    recent = Post.objects.filter(created_at__gte=timezone.now() - WINDOW)
+    ExploreCandidate.objects.bulk_create([
+        ExploreCandidate(
+            post_id=post.id,
+            author_id=post.author_id,
+            score=hot_score(post.likes_count, post.comments_count, post.saves_count, post.created_at),
+        )
+        for post in recent.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0005_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='saves_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.CreateModel(
+            name='ExploreCandidate',
+            fields=[
+                ('post', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='explore_candidate', serialize=False, to='posts.post')),
+                ('score', models.FloatField()),
+                ('refreshed_at', models.DateTimeField(auto_now=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-score', '-post'],
+                'indexes': [models.Index(fields=['-score', '-post'], name='posts_explore_score_idx')],
+            },
+        ),
+        migrations.RunPython(populate_explore, migrations.RunPython.noop),
+    ]
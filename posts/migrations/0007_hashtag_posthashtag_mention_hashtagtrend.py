@@ -0,0 +1,137 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:24
+
+import re
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+# Frozen copy of the posts.tags parsers as of this migration, so later
+# changes to them cannot change what this migration indexes
+HASHTAG_PATTERN = re.compile(r'(?<![\w&])#(\w{1,100})')
+MENTION_PATTERN = re.compile(r'(?<![\w@])@([\w.+-]{1,150})')
+
+
+def parse_hashtags(text):
+    return list(dict.fromkeys(name.lower() for name in HASHTAG_PATTERN.findall(text or '')))
+
+
+def parse_mentions(text):
+    names = (name.rstrip('.') for name in MENTION_PATTERN.findall(text or ''))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def index_existing_posts(apps, schema_editor):
+    """Build the hashtag index and mentions from existing captions and comments"""
+    User = apps.get_model('auth', 'User')
+    Post = apps.get_model('posts', 'Post')
+    Comment = apps.get_model('posts', 'Comment')
+    Hashtag = apps.get_model('posts', 'Hashtag')
+    PostHashtag = apps.get_model('posts', 'PostHashtag')
+    HashtagTrend = apps.get_model('posts', 'HashtagTrend')
+    Mention = apps.get_model('posts', 'Mention')
+    
+    tagged = []
+    mentioned = []
+    for post in Post.objects.exclude(caption='').iterator():
+        tagged.extend((name, post.id, post.created_at) for name in parse_hashtags(post.caption))
+        mentioned.extend((username, post.id, None, post.author_id) for username in parse_mentions(post.caption))
+    for comment in Comment.objects.filter(text__contains='@').iterator():
+        mentioned.extend(
+            (username, comment.post_id, comment.id, comment.author_id) for username in parse_mentions(comment.text)
+        )
+    
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in {name for name, _, _ in tagged}], ignore_conflicts=True)
+    hashtag_ids = dict(Hashtag.objects.values_list('name', 'id'))
+    PostHashtag.objects.bulk_create([
+        PostHashtag(hashtag_id=hashtag_ids[name], post_id=post_id, created_at=created_at)
+        for name, post_id, created_at in tagged
+    ], batch_size=1000, ignore_conflicts=True)
+    
+    counts = {}
+    uses = {}
+    for name, _, created_at in tagged:
+        counts[name] = counts.get(name, 0) + 1
+        key = (hashtag_ids[name], created_at.replace(minute=0, second=0, microsecond=0))
+        uses[key] = uses.get(key, 0) + 1
+    for name, count in counts.items():
+        Hashtag.objects.filter(name=name).update(posts_count=count)
+    HashtagTrend.objects.bulk_create([
+        HashtagTrend(hashtag_id=hashtag_id, bucket=bucket, uses=count)
+        for (hashtag_id, bucket), count in uses.items()
+    ], batch_size=1000)
+    
+    user_ids = dict(User.objects.filter(
+        username__in={username for username, _, _, _ in mentioned}
+    ).values_list('username', 'id'))
+    Mention.objects.bulk_create([
+        Mention(post_id=post_id, comment_id=comment_id, user_id=user_ids[username], author_id=author_id)
+        for username, post_id, comment_id, author_id in mentioned if username in user_ids
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('posts', '0006_explorecandidate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Hashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('posts_count', models.PositiveIntegerField(default=0)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='PostHashtag',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField()),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='post_links', to='posts.hashtag')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='hashtag_links', to='posts.post')),
+            ],
+            options={
+                'ordering': ['-created_at', '-post'],
+                'indexes': [models.Index(fields=['hashtag', '-created_at', '-post'], name='posts_hashtag_recent_idx')],
+                'unique_together': {('hashtag', 'post')},
+            },
+        ),
+        migrations.CreateModel(
+            name='Mention',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('author', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('comment', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='posts.comment')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to='posts.post')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='mentions', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['user', '-created_at'], name='posts_mention_user_idx'), models.Index(fields=['post', 'comment'], name='posts_mention_post_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='HashtagTrend',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('bucket', models.DateTimeField()),
+                ('uses', models.PositiveIntegerField(default=0)),
+                ('hashtag', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='trend_buckets', to='posts.hashtag')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['bucket'], name='posts_trend_bucket_idx')],
+                'unique_together': {('hashtag', 'bucket')},
+            },
+        ),
+        migrations.RunPython(index_existing_posts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2.30 on 2026-10-18 13:45
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_views(apps, schema_editor):
+    Story = apps.get_model('posts', 'Story')
+    StoryView = apps.get_model('posts', 'StoryView')
+    views = StoryView.objects.filter(story=OuterRef('pk')).order_by().values('story').annotate(total=Count('*')).values('total')
+    Story.objects.update(views_count=Coalesce(Subquery(views), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0008_story_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='story',
+            name='views_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(count_views, migrations.RunPython.noop),
+    ]
@@ -3,29 +3,33 @@ from django.contrib.auth.models import User
 from django.utils import timezone
 from datetime import timedelta
 
+from core.models import DerivedFieldsMixin
 
-class Post(models.Model):
+
+class Post(DerivedFieldsMixin, models.Model):
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='posts')
     image = models.ImageField(upload_to='posts/', blank=True, null=True)
     video = models.FileField(upload_to='posts/', blank=True, null=True)
+    # Resized JPEG/WebP copies and video poster, filled in by posts.media
+    media_variants = models.JSONField(default=dict, blank=True)
     caption = models.TextField(max_length=2200, blank=True)
     likes = models.ManyToManyField(User, related_name='liked_posts', blank=True)
+    # Denormalized counters, kept in step with F() updates (see reconcile_counters)
+    likes_count = models.PositiveIntegerField(default=0)
+    comments_count = models.PositiveIntegerField(default=0)
+    saves_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    COUNTER_FIELDS = ('likes_count', 'comments_count', 'saves_count')
+    # Written by queryset updates only (counters, and variants from the media worker)
+    DERIVED_FIELDS = COUNTER_FIELDS + ('media_variants',)
+    
     class Meta:
         ordering = ['-created_at']
     
     def __str__(self):
         return f"{self.author.username} - {self.created_at.strftime('%Y-%m-%d %H:%M')}"
-    
-    @property
-    def likes_count(self):
-        return self.likes.count()
-    
-    @property
-    def comments_count(self):
-        return self.comments.count()
 
 
 class Comment(models.Model):
@@ -41,16 +45,29 @@ class Comment(models.Model):
         return f"{self.author.username} on {self.post.id}: {self.text[:30]}"
 
 
-class Story(models.Model):
+class Story(DerivedFieldsMixin, models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='stories')
     image = models.ImageField(upload_to='stories/', blank=True, null=True)
     video = models.FileField(upload_to='stories/', blank=True, null=True)
+    # Resized JPEG/WebP copies and video poster, filled in by posts.media
+    media_variants = models.JSONField(default=dict, blank=True)
+    # Maintained by posts.story_views when buffered views are flushed
+    views_count = models.PositiveIntegerField(default=0)
     created_at = models.DateTimeField(auto_now_add=True)
     expires_at = models.DateTimeField()
     
+    # Written by queryset updates only (view counts, and variants from the media worker)
+    DERIVED_FIELDS = ('views_count', 'media_variants')
+    
     class Meta:
         ordering = ['-created_at']
         verbose_name_plural = 'Stories'
+        indexes = [
+            # Active stories per author (tray and story list)
+            models.Index(fields=['user', 'expires_at'], name='posts_story_active_idx'),
+            # Expired stories, oldest first (expiry sweeper)
+            models.Index(fields=['expires_at'], name='posts_story_expiry_idx'),
+        ]
     
     def save(self, *args, **kwargs):
         if not self.expires_at:
@@ -88,3 +105,105 @@ class SavedPost(models.Model):
     
     def __str__(self):
         return f"{self.user.username} saved {self.post.id}"
+
+
+class TimelineEntry(models.Model):
+    """A post materialized into a follower's home timeline (fan-out on write)"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='timeline_entries')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='timeline_entries')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('user', 'post')
+        ordering = ['-created_at', '-post']
+        indexes = [
+            models.Index(fields=['user', '-created_at', '-post'], name='posts_timeline_user_idx'),
+            models.Index(fields=['user', 'author'], name='posts_timeline_author_idx'),
+        ]
+        verbose_name_plural = 'Timeline entries'
+    
+    def __str__(self):
+        return f"{self.post_id} in {self.user.username}'s timeline"
+
+
+class ExploreCandidate(models.Model):
+    """A recent post in the explore pool, ranked by time-decayed engagement"""
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, primary_key=True, related_name='explore_candidate')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    score = models.FloatField()
+    refreshed_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        ordering = ['-score', '-post']
+        indexes = [
+            models.Index(fields=['-score', '-post'], name='posts_explore_score_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.post_id} ({self.score:.3f})"
+
+
+class Hashtag(models.Model):
+    name = models.CharField(max_length=100, unique=True)
+    # Denormalized number of posts carrying the tag (see reconcile_counters)
+    posts_count = models.PositiveIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class PostHashtag(models.Model):
+    """Inverted index from a hashtag to the posts that use it"""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='post_links')
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='hashtag_links')
+    created_at = models.DateTimeField()
+    
+    class Meta:
+        unique_together = ('hashtag', 'post')
+        ordering = ['-created_at', '-post']
+        indexes = [
+            models.Index(fields=['hashtag', '-created_at', '-post'], name='posts_hashtag_recent_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.post_id} tagged #{self.hashtag.name}"
+
+
+class HashtagTrend(models.Model):
+    """Uses of a hashtag within one hour, summed over recent hours for trending"""
+    hashtag = models.ForeignKey(Hashtag, on_delete=models.CASCADE, related_name='trend_buckets')
+    bucket = models.DateTimeField()
+    uses = models.PositiveIntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('hashtag', 'bucket')
+        indexes = [
+            models.Index(fields=['bucket'], name='posts_trend_bucket_idx'),
+        ]
+    
+    def __str__(self):
+        return f"#{self.hashtag.name} {self.bucket:%Y-%m-%d %H:00}: {self.uses}"
+
+
+class Mention(models.Model):
+    """A user @mentioned in a post caption (comment is empty) or in a comment"""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='mentions')
+    comment = models.ForeignKey(Comment, on_delete=models.CASCADE, related_name='mentions', blank=True, null=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='mentions')
+    author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', '-created_at'], name='posts_mention_user_idx'),
+            models.Index(fields=['post', 'comment'], name='posts_mention_post_idx'),
+        ]
+    
+    def __str__(self):
+        return f"{self.author.username} mentioned {self.user.username} on {self.post_id}"
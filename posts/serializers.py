@@ -1,18 +1,75 @@
 from rest_framework import serializers
-from .models import Post, Comment, Story, StoryView, SavedPost
+from django.contrib.auth.models import User
+from django.db.models import Prefetch
+from core import renditions
+from core.serializers import BatchedListSerializer, MediaVariantsField, SparseFieldsetMixin
+from .models import Post, Comment, Story, StoryView
 from accounts.serializers import UserSerializer
+from accounts.viewer_state import ViewerState
+
+
+# Number of most recent comments embedded in each post of a list response
+COMMENT_PREVIEW_SIZE = 2
+
+
+def avatar_url(user):
+    """Safely get a user's avatar URL"""
+    try:
+        if hasattr(user, 'profile') and user.profile.avatar:
+            return user.profile.avatar.url
+    except Exception:
+        pass
+    return None
+
+
+def post_renditions(post):
+    """Rendition URLs for a post image and its author avatar"""
+    return {
+        'image': renditions.urls_for(post.image, renditions.POST_IMAGE, post.media_variants),
+        'author_avatar': renditions.avatar_urls(post.author),
+    }
+
+
+class CommentListSerializer(BatchedListSerializer):
+    """Resolves viewer state for all comment authors with one query"""
+    
+    def prepare(self, comments):
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            state.resolve(user_ids=[comment.author_id for comment in comments])
+
+
+class PostListSerializer(BatchedListSerializer):
+    """Resolves likes, saves and follows for the whole page before serializing it"""
+    
+    def prepare(self, posts):
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            # Only post authors carry follow state; comment previews do not
+            state.resolve(post_ids=[post.id for post in posts], user_ids={post.author_id for post in posts})
+
+
+class StoryListSerializer(BatchedListSerializer):
+    """Resolves is_following for every story author with one query"""
+    
+    def prepare(self, stories):
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            state.resolve(user_ids={story.user_id for story in stories})
 
 
 class CommentSerializer(serializers.ModelSerializer):
     author = UserSerializer(read_only=True)
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = Comment
-        fields = ('id', 'post', 'author', 'author_username', 'author_avatar', 
+        fields = ('id', 'post', 'author', 'author_username', 'author_avatar', 'renditions',
                   'text', 'created_at')
         read_only_fields = ('post', 'author', 'created_at')
+        list_serializer_class = CommentListSerializer
     
     def get_author_avatar(self, obj):
         """Safely get author avatar URL"""
@@ -22,51 +79,109 @@ class CommentSerializer(serializers.ModelSerializer):
         except:
             pass
         return None
+    
+    def get_renditions(self, obj):
+        return {'author_avatar': renditions.avatar_urls(obj.author)}
 
 
-class PostSerializer(serializers.ModelSerializer):
-    author = UserSerializer(read_only=True)
+class AuthorSummarySerializer(serializers.ModelSerializer):
+    avatar = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
+    is_following = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = User
+        fields = ('id', 'username', 'avatar', 'renditions', 'is_following')
+    
+    def get_avatar(self, obj):
+        return avatar_url(obj)
+    
+    def get_renditions(self, obj):
+        return {'avatar': renditions.avatar_urls(obj)}
+    
+    def get_is_following(self, obj):
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            return state.is_following(obj)
+        return False
+
+
+class CommentPreviewSerializer(serializers.ModelSerializer):
+    author_username = serializers.CharField(source='author.username', read_only=True)
+    author_avatar = serializers.SerializerMethodField()
+    renditions = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Comment
+        fields = ('id', 'author_username', 'author_avatar', 'renditions', 'text', 'created_at')
+    
+    def get_author_avatar(self, obj):
+        return avatar_url(obj.author)
+    
+    def get_renditions(self, obj):
+        return {'author_avatar': renditions.avatar_urls(obj.author)}
+
+
+class PostSummarySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    """
+    Compact post representation for feed, explore and profile grids.
+    
+    Embeds only the latest COMMENT_PREVIEW_SIZE comments; full threads are
+    served by the comments endpoint. Querysets must go through
+    ``setup_eager_loading`` so the preview is fetched in one query.
+    """
+    author = AuthorSummarySerializer(read_only=True)
     author_username = serializers.CharField(source='author.username', read_only=True)
     author_avatar = serializers.SerializerMethodField()
-    likes_count = serializers.SerializerMethodField()
-    comments_count = serializers.SerializerMethodField()
     is_liked = serializers.SerializerMethodField()
     is_saved = serializers.SerializerMethodField()
-    comments = CommentSerializer(many=True, read_only=True)
+    comments_preview = serializers.SerializerMethodField()
+    media_variants = MediaVariantsField()
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = Post
-        fields = ('id', 'author', 'author_username', 'author_avatar', 'image', 'video',
-                  'caption', 'likes_count', 'comments_count', 'is_liked', 'is_saved',
-                  'comments', 'created_at', 'updated_at')
-        read_only_fields = ('author', 'created_at', 'updated_at')
+        fields = ('id', 'author', 'author_username', 'author_avatar', 'image', 'video', 'media_variants',
+                  'renditions', 'caption', 'likes_count', 'comments_count', 'is_liked', 'is_saved',
+                  'comments_preview', 'created_at')
+        read_only_fields = fields
+        list_serializer_class = PostListSerializer
     
-    def get_author_avatar(self, obj):
-        """Safely get author avatar URL"""
-        try:
-            if hasattr(obj.author, 'profile') and obj.author.profile.avatar:
-                return obj.author.profile.avatar.url
-        except:
-            pass
-        return None
+    @staticmethod
+    def setup_eager_loading(queryset):
+        preview = Comment.objects.select_related('author', 'author__profile').order_by(
+            '-created_at', '-id'
+        )[:COMMENT_PREVIEW_SIZE]
+        return queryset.select_related('author', 'author__profile').prefetch_related(
+            Prefetch('comments', queryset=preview, to_attr='preview_comments')
+        )
     
-    def get_likes_count(self, obj):
-        return obj.likes.count()
+    def get_author_avatar(self, obj):
+        return avatar_url(obj.author)
     
-    def get_comments_count(self, obj):
-        return obj.comments.count()
+    def get_renditions(self, obj):
+        return post_renditions(obj)
     
     def get_is_liked(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return request.user in obj.likes.all()
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            return state.is_liked(obj)
         return False
     
     def get_is_saved(self, obj):
-        request = self.context.get('request')
-        if request and request.user.is_authenticated:
-            return SavedPost.objects.filter(user=request.user, post=obj).exists()
+        state = ViewerState.for_context(self.context)
+        if state is not None:
+            return state.is_saved(obj)
         return False
+    
+    def get_comments_preview(self, obj):
+        comments = getattr(obj, 'preview_comments', None)
+        if comments is None:
+            comments = obj.comments.select_related('author', 'author__profile').order_by(
+                '-created_at', '-id'
+            )[:COMMENT_PREVIEW_SIZE]
+        # Oldest first, the way threads are displayed
+        return CommentPreviewSerializer(reversed(list(comments)), many=True, context=self.context).data
 
 
 class PostCreateSerializer(serializers.ModelSerializer):
@@ -94,13 +209,15 @@ class StorySerializer(serializers.ModelSerializer):
     user_avatar = serializers.SerializerMethodField()
     is_active = serializers.BooleanField(read_only=True)
     is_viewed = serializers.SerializerMethodField()
-    views_count = serializers.SerializerMethodField()
+    media_variants = MediaVariantsField()
+    renditions = serializers.SerializerMethodField()
     
     class Meta:
         model = Story
-        fields = ('id', 'user', 'username', 'user_avatar', 'image', 'video',
+        fields = ('id', 'user', 'username', 'user_avatar', 'image', 'video', 'media_variants', 'renditions',
                   'is_active', 'is_viewed', 'views_count', 'created_at', 'expires_at')
-        read_only_fields = ('user', 'created_at', 'expires_at')
+        read_only_fields = ('user', 'views_count', 'created_at', 'expires_at')
+        list_serializer_class = StoryListSerializer
     
     def get_user_avatar(self, obj):
         """Safely get user avatar URL"""
@@ -111,15 +228,19 @@ class StorySerializer(serializers.ModelSerializer):
             pass
         return None
     
+    def get_renditions(self, obj):
+        return {
+            'image': renditions.urls_for(obj.image, renditions.STORY_IMAGE, obj.media_variants),
+            'user_avatar': renditions.avatar_urls(obj.user),
+        }
+    
     def get_is_viewed(self, obj):
         request = self.context.get('request')
         if request and request.user.is_authenticated:
+            if hasattr(obj, 'viewed'):
+                return obj.viewed
             return StoryView.objects.filter(story=obj, viewer=request.user).exists()
         return False
-    
-    def get_views_count(self, obj):
-        """Get the number of views for this story"""
-        return obj.views.count()
 
 
 class StoryViewSerializer(serializers.ModelSerializer):
@@ -0,0 +1,140 @@
+"""
+The story tray.
+
+The home page shows one ring per author with active stories, unseen rings
+first. ``tray`` answers that with aggregate queries over the viewer's
+audience (themselves, who they follow and who follows them): one GROUP BY
+for each author's latest timestamp and unseen count, one query for the
+story ids and one for the authors, instead of serializing every story and
+grouping them on the client.
+
+Expired stories are removed by ``expire`` (the ``expire_stories`` command)
+in batches: their views are deleted in chunks, each committed on its own,
+then the stories, and the media files are removed from storage once that
+has committed.
+"""
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models import Case, Count, Exists, IntegerField, Max, OuterRef, Q, Value, When
+from django.utils import timezone
+
+from accounts.models import Follow
+from core import renditions
+from . import media
+from .models import Story, StoryView
+
+
+# Most authors shown in the tray
+TRAY_LIMIT = 100
+
+# Stories (and story views) deleted per statement by the expiry sweeper
+BATCH_SIZE = 500
+
+
+def audience(user):
+    """Stories the user can see: their own and those of people they follow or who follow them"""
+    return (
+        Q(user_id=user.id)
+        | Q(user_id__in=Follow.objects.following_user_ids(user.id))
+        | Q(user_id__in=Follow.objects.follower_user_ids(user.id))
+    )
+
+
+def active_stories(user):
+    return Story.objects.filter(audience(user), expires_at__gt=timezone.now())
+
+
+def with_viewer_state(stories, user):
+    """Annotate ``viewed``: whether the user has seen each story"""
+    return stories.annotate(
+        viewed=Exists(StoryView.objects.filter(story=OuterRef('pk'), viewer_id=user.id))
+    )
+
+
+def tray(user, limit=TRAY_LIMIT):
+    """One entry per author: own stories first, then unseen rings, newest first"""
+    stories = active_stories(user)
+    authors = list(
+        with_viewer_state(stories, user)
+        .order_by().values('user_id')
+        .annotate(
+            latest_at=Max('created_at'),
+            unseen=Count('id', filter=Q(viewed=False)),
+        )
+        .order_by(
+            Case(When(user_id=user.id, then=Value(0)), default=Value(1), output_field=IntegerField()),
+            Case(When(unseen=0, then=Value(1)), default=Value(0), output_field=IntegerField()),
+            '-latest_at',
+        )[:limit]
+    )
+    author_ids = [author['user_id'] for author in authors]
+
+    story_ids = {}
+    for user_id, story_id in stories.filter(user_id__in=author_ids).order_by('created_at').values_list('user_id', 'id'):
+        story_ids.setdefault(user_id, []).append(story_id)
+    users = User.objects.select_related('profile').in_bulk(author_ids)
+
+    return [
+        {
+            'user': summary(users[author['user_id']]),
+            'story_ids': story_ids.get(author['user_id'], []),
+            'latest_at': author['latest_at'],
+            'all_seen': author['unseen'] == 0,
+        }
+        for author in authors if author['user_id'] in users
+    ]
+
+
+def summary(user):
+    profile = getattr(user, 'profile', None)
+    return {
+        'id': user.id,
+        'username': user.username,
+        'avatar': profile.avatar.url if profile and profile.avatar else None,
+        'avatar_renditions': renditions.avatar_urls(user),
+    }
+
+
+def delete_stories(story_ids, batch_size=BATCH_SIZE):
+    """
+    Delete the stories, their views and (after commit) their media files.
+    Each chunk of views is deleted in its own transaction, so no statement
+    holds locks for longer than one chunk; only the stories and their file
+    cleanup are committed together.
+    """
+    views_deleted = 0
+    while True:
+        with transaction.atomic():
+            view_ids = list(
+                StoryView.objects.filter(story_id__in=story_ids).values_list('id', flat=True)[:batch_size]
+            )
+            if not view_ids:
+                break
+            views_deleted += StoryView.objects.filter(id__in=view_ids).delete()[0]
+
+    with transaction.atomic():
+        rows = list(Story.objects.filter(id__in=story_ids).values_list('image', 'video', 'media_variants'))
+        files = [name for row in rows for name in media.stored_names(*row)]
+        # Views recorded since the last chunk go with their story (by cascade)
+        Story.objects.filter(id__in=story_ids).delete()
+        transaction.on_commit(lambda: media.remove_files(files))
+    # Reported: uploads and variants; cached renditions are removed if there are any
+    return views_deleted, sum(len(media.upload_names(*row)) for row in rows)
+
+
+def expire(now=None, batch_size=BATCH_SIZE):
+    """Delete every story past its expiry, batch by batch. Returns (stories, views, files)."""
+    now = now or timezone.now()
+    stories_deleted = views_deleted = files_deleted = 0
+    while True:
+        story_ids = list(
+            Story.objects.filter(expires_at__lte=now)
+            .order_by('expires_at').values_list('id', flat=True)[:batch_size]
+        )
+        if not story_ids:
+            break
+        views, files = delete_stories(story_ids, batch_size=batch_size)
+        stories_deleted += len(story_ids)
+        views_deleted += views
+        files_deleted += files
+    return stories_deleted, views_deleted, files_deleted
@@ -0,0 +1,88 @@
+"""
+Write-behind recording of story views.
+
+Opening a story used to run ``get_or_create`` on ``StoryView``: a SELECT
+and an INSERT for every story a viewer taps through, racing the unique
+constraint when the same story was opened twice at once. ``record`` only
+adds (story, viewer) to an in-process buffer. ``flush`` writes the buffer
+with one ``bulk_create(ignore_conflicts=True)`` and adds the views it
+actually stored to ``views_count`` with F() updates. The buffer is flushed
+on the background pool when it reaches FLUSH_SIZE or FLUSH_INTERVAL
+seconds after its first entry. Reads never flush, so seen state in the
+tray may lag by up to FLUSH_INTERVAL; the story viewer remembers what it
+showed and greys those rings itself.
+"""
+import threading
+from collections import Counter
+
+from django.db import transaction
+from django.db.models import F
+
+from core.background import submit
+from .models import Story, StoryView
+
+
+FLUSH_SIZE = 200
+FLUSH_INTERVAL = 5.0
+
+_lock = threading.Lock()
+_pending = set()
+_timer = None
+
+
+def record(story_id, viewer_id):
+    """Buffer a view; it is written with the next flush"""
+    global _timer
+    with _lock:
+        _pending.add((story_id, viewer_id))
+        full = len(_pending) >= FLUSH_SIZE
+        if not full and _timer is None:
+            _timer = threading.Timer(FLUSH_INTERVAL, submit, args=(flush,))
+            _timer.daemon = True
+            _timer.start()
+    if full:
+        submit(flush)
+
+
+def _take():
+    global _pending, _timer
+    with _lock:
+        pairs, _pending = _pending, set()
+        timer, _timer = _timer, None
+    if timer is not None:
+        timer.cancel()
+    return pairs
+
+
+def flush():
+    """Write buffered views in one bulk insert and count them on their stories. Returns the views written."""
+    pairs = _take()
+    if not pairs:
+        return 0
+
+    story_ids = {story_id for story_id, _ in pairs}
+    viewer_ids = {viewer_id for _, viewer_id in pairs}
+    with transaction.atomic():
+        # Locking the stories serializes flushes from other processes, so the
+        # views not stored yet are exactly the ones this insert adds. Stories
+        # may have expired or been deleted since they were opened.
+        live = set(Story.objects.select_for_update().filter(id__in=story_ids).values_list('id', flat=True))
+        seen = set(
+            StoryView.objects.filter(story_id__in=live, viewer_id__in=viewer_ids)
+            .values_list('story_id', 'viewer_id')
+        )
+        new = [
+            (story_id, viewer_id) for story_id, viewer_id in pairs
+            if story_id in live and (story_id, viewer_id) not in seen
+        ]
+        StoryView.objects.bulk_create([
+            StoryView(story_id=story_id, viewer_id=viewer_id) for story_id, viewer_id in new
+        ], ignore_conflicts=True)
+
+        # One UPDATE per distinct number of new views, not per story
+        by_count = {}
+        for story_id, count in Counter(story_id for story_id, _ in new).items():
+            by_count.setdefault(count, []).append(story_id)
+        for count, ids in by_count.items():
+            Story.objects.filter(id__in=ids).update(views_count=F('views_count') + count)
+    return len(new)
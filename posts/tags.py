@@ -0,0 +1,143 @@
+"""
+Hashtags and @mentions.
+
+Captions and comments are parsed when they are written. Hashtags go into
+the ``PostHashtag`` inverted index, so a tag page is one range scan over
+``(hashtag, created_at)`` instead of a LIKE over every caption. Each use
+also bumps an hourly ``HashtagTrend`` bucket, and trending tags are the
+sum of the last TRENDING_WINDOW of buckets. Mentions are stored per post
+or comment and notify the mentioned users with one bulk insert.
+"""
+import re
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db.models import F, Sum
+from django.utils import timezone
+
+from core.pagination import KeysetPagination
+from accounts.notifications import Event, notify_many
+from .models import Hashtag, HashtagTrend, Mention, PostHashtag
+
+
+HASHTAG_PATTERN = re.compile(r'(?<![\w&])#(\w{1,100})')
+MENTION_PATTERN = re.compile(r'(?<![\w@])@([\w.+-]{1,150})')
+
+# Hours summed for trending, and how long buckets are kept before pruning
+TRENDING_WINDOW = timedelta(hours=24)
+TREND_RETENTION = timedelta(days=7)
+
+
+def normalize_tag(name):
+    return name.lower()
+
+
+def parse_hashtags(text):
+    """Distinct normalized hashtags in order of first use"""
+    return list(dict.fromkeys(normalize_tag(name) for name in HASHTAG_PATTERN.findall(text or '')))
+
+
+def parse_mentions(text):
+    """Distinct @usernames in order of first use, without trailing punctuation"""
+    names = (name.rstrip('.') for name in MENTION_PATTERN.findall(text or ''))
+    return list(dict.fromkeys(name for name in names if name))
+
+
+def current_bucket():
+    return timezone.now().replace(minute=0, second=0, microsecond=0)
+
+
+def _hashtags_named(names):
+    """Hashtag rows for the names, creating the missing ones"""
+    Hashtag.objects.bulk_create([Hashtag(name=name) for name in names], ignore_conflicts=True)
+    return list(Hashtag.objects.filter(name__in=names))
+
+
+def _record_uses(hashtag_ids):
+    bucket = current_bucket()
+    rows = HashtagTrend.objects.filter(hashtag_id__in=hashtag_ids, bucket=bucket)
+    existing = set(rows.values_list('hashtag_id', flat=True))
+    rows.update(uses=F('uses') + 1)
+
+    new_ids = [hashtag_id for hashtag_id in hashtag_ids if hashtag_id not in existing]
+    if new_ids:
+        HashtagTrend.objects.bulk_create([
+            HashtagTrend(hashtag_id=hashtag_id, bucket=bucket, uses=1) for hashtag_id in new_ids
+        ], ignore_conflicts=True)
+        # First use this hour: a good moment to drop the tag's expired buckets
+        HashtagTrend.objects.filter(hashtag_id__in=new_ids, bucket__lt=bucket - TREND_RETENTION).delete()
+
+
+def index_post(post):
+    """Bring the post's hashtag links in line with its caption"""
+    names = set(parse_hashtags(post.caption))
+    current = dict(
+        PostHashtag.objects.filter(post=post).values_list('hashtag__name', 'hashtag_id')
+    )
+
+    removed_ids = [hashtag_id for name, hashtag_id in current.items() if name not in names]
+    if removed_ids:
+        PostHashtag.objects.filter(post=post, hashtag_id__in=removed_ids).delete()
+        Hashtag.objects.filter(id__in=removed_ids).update(posts_count=F('posts_count') - 1)
+
+    added = [name for name in names if name not in current]
+    if added:
+        hashtags = _hashtags_named(added)
+        PostHashtag.objects.bulk_create([
+            PostHashtag(hashtag=hashtag, post=post, created_at=post.created_at) for hashtag in hashtags
+        ], ignore_conflicts=True)
+        hashtag_ids = [hashtag.id for hashtag in hashtags]
+        Hashtag.objects.filter(id__in=hashtag_ids).update(posts_count=F('posts_count') + 1)
+        _record_uses(hashtag_ids)
+
+
+def unindex_post(post):
+    """Release the post's hashtags before it is deleted"""
+    hashtag_ids = list(PostHashtag.objects.filter(post=post).values_list('hashtag_id', flat=True))
+    Hashtag.objects.filter(id__in=hashtag_ids).update(posts_count=F('posts_count') - 1)
+
+
+def record_mentions(post, author, text, comment=None):
+    """Store new @mentions in a caption or comment and notify those users in bulk"""
+    usernames = parse_mentions(text)
+    mentions = Mention.objects.filter(post=post, comment=comment)
+    # An edited caption drops the mentions it no longer contains
+    mentions.exclude(user__username__in=usernames).delete()
+    if not usernames:
+        return []
+
+    already = set(mentions.values_list('user_id', flat=True))
+    users = [
+        user for user in User.objects.filter(username__in=usernames).only('id')
+        if user.id not in already
+    ]
+    if not users:
+        return []
+
+    Mention.objects.bulk_create([
+        Mention(post=post, comment=comment, user=user, author=author) for user in users
+    ])
+    notify_many([Event(user.id, author.id, 'mention', 'post', post.id) for user in users])
+    return users
+
+
+class TagPagination(KeysetPagination):
+    """Pages a tag's posts along its (hashtag, created_at, post) index"""
+    page_size = 24
+    ordering = ('-created_at', '-post_id')
+
+
+def posts_for_tag(name):
+    """Index entries for the tag, newest post first"""
+    return PostHashtag.objects.filter(hashtag__name=normalize_tag(name)).order_by('-created_at', '-post_id')
+
+
+def trending(limit=10):
+    """Most used hashtags over the trending window"""
+    since = current_bucket() - TRENDING_WINDOW
+    return list(
+        HashtagTrend.objects.filter(bucket__gt=since)
+        .values(name=F('hashtag__name'), posts_count=F('hashtag__posts_count'))
+        .annotate(uses=Sum('uses'))
+        .order_by('-uses', 'name')[:limit]
+    )
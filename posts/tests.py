@@ -1,3 +1,434 @@
-from django.test import TestCase
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from io import BytesIO, StringIO
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from accounts.models import Notification
+from core import renditions
+from . import story_views
+from .models import Comment, Post, SavedPost, Story, StoryView, TimelineEntry
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class ToggleTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.reader = User.objects.create_user('reader')
+        self.post = Post.objects.create(author=self.author, image='posts/p.jpg')
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def test_like_moves_counter_and_notifies_once(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.assertEqual(response.json()['status'], 'liked')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 1)
+        self.assertEqual(Notification.objects.filter(recipient=self.author, verb='like').count(), 1)
+
+        self.assertEqual(self.client.post(f'/api/posts/{self.post.pk}/like/').json()['status'], 'unliked')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_unlike_never_drops_counter_below_zero(self):
+        self.post.likes.add(self.reader)
+        Post.objects.filter(pk=self.post.pk).update(likes_count=0)
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.likes_count, 0)
+
+    def test_saving_a_stale_copy_keeps_derived_fields(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.client.post(f'/api/posts/{self.post.pk}/like/')
+        Post.objects.filter(pk=self.post.pk).update(media_variants={'jpeg': {'320': 'v.jpg'}})
+        stale.caption = 'edited'
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.caption, self.post.likes_count), ('edited', 1))
+        self.assertEqual(self.post.media_variants, {'jpeg': {'320': 'v.jpg'}})
+
+    def test_unsave_never_drops_counter_below_zero(self):
+        SavedPost.objects.create(user=self.reader, post=self.post)
+        self.assertEqual(self.client.post(f'/api/posts/{self.post.pk}/save/').json()['status'], 'unsaved')
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.saves_count, 0)
+
+
+def upload(width, height, name='p.jpg', color='red'):
+    fmt = 'PNG' if name.endswith('.png') else 'JPEG'
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), color).save(buffer, fmt)
+    return SimpleUploadedFile(name, buffer.getvalue(), content_type=f'image/{fmt.lower()}')
+
+
+class MediaTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.root, BACKGROUND_TASKS_EAGER=True)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.user = User.objects.create_user('author')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(path, name), self.root)
+            for path, _, names in os.walk(self.root) for name in names
+        )
+
+    def create_post(self, width, height, name='p.jpg', color='red'):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(
+                '/api/posts/', {'image': upload(width, height, name, color), 'caption': 'x'}, format='multipart'
+            )
+        return Post.objects.latest('id')
+
+    def rendition_color(self, post, rendition='grid_320'):
+        url = self.client.get(f'/api/posts/{post.pk}/').json()['renditions']['image'][rendition]
+        response = self.client.get(url)
+        return Image.open(BytesIO(b''.join(response.streaming_content))).getpixel((0, 0))
+
+    def test_width_renditions_are_served_from_stored_variants(self):
+        post = self.create_post(2000, 1000)
+        self.assertEqual(sorted(post.media_variants['webp']), ['1080', '320', '640'])
+
+        urls = self.client.get(f'/api/posts/{post.pk}/').json()['renditions']['image']
+        response = self.client.get(urls['grid_320'], HTTP_ACCEPT='image/webp')
+        self.assertEqual(Image.open(BytesIO(b''.join(response.streaming_content))).size, (320, 160))
+        self.client.get(urls['feed_1080'])
+        self.assertFalse(os.path.exists(os.path.join(self.root, renditions.RENDITIONS_DIR)))
+
+    def test_originals_that_differ_only_in_extension_keep_their_own_variants(self):
+        red = self.create_post(800, 600, 'a.jpg', 'red')
+        blue = self.create_post(800, 600, 'a.png', 'blue')
+        self.assertGreater(self.rendition_color(blue)[2], 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.delete(f'/api/posts/{red.pk}/')
+        self.assertGreater(self.rendition_color(blue)[2], 200)
+        self.assertFalse(os.path.exists(os.path.join(self.root, renditions.RENDITIONS_DIR)))
+
+    def test_rebuilt_variants_are_served_from_the_new_map(self):
+        post = self.create_post(800, 600)
+        call_command('process_media', all=True, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertTrue(all(
+            os.path.exists(os.path.join(self.root, name)) for name in post.media_variants['jpeg'].values()
+        ))
+        self.rendition_color(post)
+        self.assertFalse(os.path.exists(os.path.join(self.root, renditions.RENDITIONS_DIR)))
+
+    def test_small_image_fills_the_width_it_fits_in(self):
+        post = self.create_post(500, 500)
+        self.assertEqual(sorted(post.media_variants['jpeg']), ['320', '640'])
+
+    def test_concurrent_renders_only_ever_expose_complete_files(self):
+        post = Post.objects.create(author=self.user, image=upload(1200, 900))
+        with ThreadPoolExecutor(max_workers=4) as pool:
+            names = set(pool.map(lambda _: renditions.render('avatar_150', post.image.name, 'webp'), range(8)))
+        self.assertEqual(len(names), 1)
+        with Image.open(os.path.join(self.root, names.pop())) as image:
+            self.assertEqual(image.size, (150, 150))
+        self.assertFalse([name for name in self.stored_files() if name.endswith('.part')])
+
+    def test_cached_renditions_of_originals_that_differ_only_in_extension_are_kept_apart(self):
+        red = default_storage.save('avatars/x.jpg', upload(200, 200, 'x.jpg', 'red'))
+        blue = default_storage.save('avatars/x.png', upload(200, 200, 'x.png', 'blue'))
+        names = [renditions.render('avatar_64', name, 'jpeg') for name in (red, blue)]
+        self.assertEqual(len(set(names)), 2)
+        with default_storage.open(names[1]) as cached:
+            self.assertGreater(Image.open(cached).getpixel((0, 0))[2], 200)
+        self.assertIn(names[0], renditions.cached_names(red))
+        self.assertNotIn(names[1], renditions.cached_names(red))
+
+    def test_delete_removes_original_variants_and_renditions(self):
+        post = self.create_post(800, 600)
+        # A cropped rendition has no matching variant, so it is cached separately
+        self.client.get(renditions.url(post.image.name, 'avatar_64'))
+        self.assertIn(renditions.RENDITIONS_DIR, {name.split(os.sep)[0] for name in self.stored_files()})
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(f'/api/posts/{post.pk}/').status_code, 204)
+        self.assertEqual(self.stored_files(), [])
+
+
+class StoryViewTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.viewers = [User.objects.create_user(f'viewer{i}') for i in range(3)]
+        self.story = Story.objects.create(user=self.author, image='stories/s.jpg')
+
+    def test_flush_counts_only_views_that_were_stored(self):
+        for viewer in self.viewers:
+            story_views.record(self.story.id, viewer.id)
+        # Another process already wrote (and counted) one of the views
+        StoryView.objects.create(story=self.story, viewer=self.viewers[0])
+        Story.objects.filter(pk=self.story.pk).update(views_count=1)
+
+        self.assertEqual(story_views.flush(), 2)
+        self.story.refresh_from_db()
+        self.assertEqual(self.story.views_count, 3)
+        self.assertEqual(StoryView.objects.filter(story=self.story).count(), 3)
+
+    def test_flush_adds_to_the_counter_without_recounting_rows(self):
+        other = Story.objects.create(user=self.author, image='stories/t.jpg')
+        Story.objects.filter(pk=self.story.pk).update(views_count=40)
+        for viewer in self.viewers:
+            story_views.record(self.story.id, viewer.id)
+        story_views.record(other.id, self.viewers[0].id)
+
+        with CaptureQueriesContext(connection) as queries:
+            story_views.flush()
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+        self.story.refresh_from_db()
+        other.refresh_from_db()
+        self.assertEqual((self.story.views_count, other.views_count), (43, 1))
+
+    def test_reads_do_not_flush_buffered_views(self):
+        story_views.record(self.story.id, self.viewers[0].id)
+        self.addCleanup(story_views.flush)
+        client = APIClient()
+        client.force_authenticate(self.viewers[0])
+        client.get('/api/stories/tray/')
+        client.get('/api/stories/')
+        self.assertFalse(StoryView.objects.exists())
+
+
+class StoryListTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def add_author(self, name):
+        author = User.objects.create_user(name)
+        Story.objects.create(user=author, image='stories/s.jpg')
+        self.client.post(f'/api/profile/{name}/follow/')
+
+    def list_queries(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/stories/')
+        return len(queries)
+
+    def test_follow_state_is_resolved_once_for_every_author(self):
+        self.add_author('author0')
+        one_author = self.list_queries()
+        for i in range(1, 7):
+            self.add_author(f'author{i}')
+        self.assertEqual(self.list_queries(), one_author)
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def walk(self, url):
+        pages = []
+        while url:
+            data = self.client.get(url).json()
+            pages.append(data['results'])
+            url = data['next']
+        return pages
+
+    def test_pages_follow_the_cursor_and_break_ties_on_id(self):
+        post = Post.objects.create(author=self.author, image='posts/p.jpg')
+        comments = [Comment.objects.create(post=post, author=self.author, text=f'c{i}') for i in range(5)]
+        # Every comment written in the same instant: only the id orders them
+        Comment.objects.update(created_at=comments[0].created_at)
+
+        pages = self.walk(f'/api/posts/{post.pk}/comments/?page_size=2')
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        self.assertEqual([c['id'] for page in pages for c in page], [c.id for c in comments])
+
+    def test_newest_first_without_counting_rows(self):
+        posts = [Post.objects.create(author=self.author, image='posts/p.jpg') for _ in range(5)]
+        with CaptureQueriesContext(connection) as queries:
+            pages = self.walk('/api/posts/user/author/?page_size=2')
+        self.assertEqual([p['id'] for page in pages for p in page], [p.id for p in reversed(posts)])
+        self.assertFalse([query for query in queries if 'COUNT(' in query['sql']])
+
+    def test_bad_cursors_are_rejected(self):
+        for cursor in ('zzz', 'WzFd', 'WyJub3QgYSBkYXRlIiwgMV0='):
+            response = self.client.get('/api/posts/user/author/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 404, cursor)
+
+
+class StoryTrayTests(TestCase):
+    def setUp(self):
+        self.viewer = User.objects.create_user('viewer')
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.start = timezone.now() - timedelta(hours=1)
+
+    def story(self, user, minutes, **fields):
+        story = Story.objects.create(user=user, image='stories/s.jpg', **fields)
+        Story.objects.filter(pk=story.pk).update(created_at=self.start + timedelta(minutes=minutes))
+        return story
+
+    def followed(self, name):
+        user = User.objects.create_user(name)
+        self.client.post(f'/api/profile/{name}/follow/')
+        return user
+
+    def tray(self):
+        with CaptureQueriesContext(connection) as queries:
+            entries = self.client.get('/api/stories/tray/').json()
+        return entries, len(queries)
+
+    def test_own_ring_first_then_unseen_then_seen_newest_first(self):
+        seen, older, newer = self.followed('seen'), self.followed('older'), self.followed('newer')
+        stranger = User.objects.create_user('stranger')
+        own = self.story(self.viewer, 1)
+        seen_story = self.story(seen, 50)
+        older_stories = [self.story(older, 10), self.story(older, 20)]
+        self.story(newer, 30)
+        self.story(newer, 40, expires_at=timezone.now() - timedelta(minutes=1))
+        self.story(stranger, 45)
+        StoryView.objects.create(story=seen_story, viewer=self.viewer)
+        StoryView.objects.create(story=older_stories[0], viewer=self.viewer)
+
+        entries, _ = self.tray()
+        self.assertEqual(
+            [(entry['user']['username'], entry['all_seen']) for entry in entries],
+            [('viewer', False), ('newer', False), ('older', False), ('seen', True)],
+        )
+        self.assertEqual(entries[0]['story_ids'], [own.id])
+        self.assertEqual(entries[2]['story_ids'], [story.id for story in older_stories])
+
+    def test_tray_costs_the_same_queries_for_any_number_of_authors(self):
+        self.story(self.followed('author0'), 1)
+        _, one_author = self.tray()
+        for i in range(1, 6):
+            self.story(self.followed(f'author{i}'), i)
+        entries, queries = self.tray()
+        self.assertEqual(len(entries), 6)
+        self.assertEqual(queries, one_author)
+
+
+class StoryExpiryTests(TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+        settings = override_settings(MEDIA_ROOT=self.root)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.author = User.objects.create_user('author')
+        self.viewers = [User.objects.create_user(f'viewer{i}') for i in range(3)]
+
+    def story(self, expired):
+        story = Story.objects.create(user=self.author, image=upload(50, 50, 's.jpg'))
+        if expired:
+            Story.objects.filter(pk=story.pk).update(expires_at=timezone.now() - timedelta(minutes=1))
+        for viewer in self.viewers:
+            StoryView.objects.create(story=story, viewer=viewer)
+        return story
+
+    def test_sweeper_deletes_expired_stories_views_and_files_in_batches(self):
+        expired = [self.story(expired=True) for _ in range(3)]
+        active = self.story(expired=False)
+
+        out = StringIO()
+        with CaptureQueriesContext(connection) as queries, self.captureOnCommitCallbacks(execute=True):
+            call_command('expire_stories', batch_size=2, stdout=out)
+        self.assertIn('Deleted 3 expired stories, 9 story views and 3 media files', out.getvalue())
+        self.assertEqual(list(Story.objects.all()), [active])
+        self.assertEqual(StoryView.objects.count(), 3)
+        for story in expired:
+            self.assertFalse(default_storage.exists(story.image.name))
+        self.assertTrue(default_storage.exists(active.image.name))
+
+        # Each chunk of views is committed (here: released) before the next one
+        chunk_deletes = [
+            query for query in queries
+            if query['sql'].startswith('DELETE FROM "posts_storyview" WHERE "posts_storyview"."id" IN')
+        ]
+        releases = [query for query in queries if query['sql'].startswith('RELEASE SAVEPOINT')]
+        self.assertEqual(len(chunk_deletes), 5)
+        self.assertGreater(len(releases), len(chunk_deletes))
+
+
+class PostDetailTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.post = Post.objects.create(author=self.author, image='posts/p.jpg')
+        commenters = [User.objects.create_user(f'commenter{i}') for i in range(6)]
+        for index, commenter in enumerate(commenters * 3):
+            Comment.objects.create(post=self.post, author=commenter, text=f'comment {index}')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_detail_embeds_only_the_comment_preview(self):
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(f'/api/posts/{self.post.pk}/').json()
+        self.assertNotIn('comments', data)
+        self.assertEqual([c['text'] for c in data['comments_preview']], ['comment 16', 'comment 17'])
+        # Post, preview, likes, saves and the author's follow state; none per commenter
+        self.assertLessEqual(len(queries), 6)
+
+    def test_list_does_not_resolve_follow_state_for_comment_authors(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get('/api/posts/')
+        follow_lookups = [query for query in queries if 'accounts_follow' in query['sql']]
+        self.assertEqual(len(follow_lookups), 1)
+        self.assertIn(f'IN ({self.author.id})', follow_lookups[0]['sql'].replace('"', ''))
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class HashtagTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('author')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def test_a_tag_named_trending_has_its_own_page(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/posts/', {'image': upload(50, 50), 'caption': 'hot #trending'}, format='multipart')
+        post = Post.objects.get()
+
+        tagged = self.client.get('/api/tags/trending/').json()
+        self.assertEqual([item['id'] for item in tagged['results']], [post.id])
+        trending = self.client.get('/api/trending-tags/').json()
+        self.assertIn('trending', [entry['name'] for entry in trending])
+
+
+@override_settings(BACKGROUND_TASKS_EAGER=True)
+class TimelineTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user('author')
+        self.followers = [User.objects.create_user(f'follower{i}') for i in range(3)]
+        for follower in self.followers:
+            client = APIClient()
+            client.force_authenticate(follower)
+            client.post(f'/api/profile/{self.author.username}/follow/')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def test_fan_out_runs_after_the_post_commits(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.client.post('/api/posts/', {'image': upload(50, 50), 'caption': 'x'}, format='multipart')
+        self.assertFalse(TimelineEntry.objects.exists())
+
+        for callback in callbacks:
+            callback()
+        post = Post.objects.get()
+        self.assertEqual(
+            sorted(TimelineEntry.objects.filter(post=post).values_list('user_id', flat=True)),
+            [follower.id for follower in self.followers],
+        )
@@ -0,0 +1,76 @@
+"""
+Materialized home timelines.
+
+Posts are pushed into every follower's timeline when they are created
+(fan-out on write), so reading the home feed is a single range scan over
+the ``(user, created_at)`` index of ``TimelineEntry`` instead of an
+``author__in`` query over everyone the user follows. The fan-out is
+deferred until the post has committed, so an account with many followers
+does not hold up its own upload.
+"""
+from core.pagination import KeysetPagination
+from accounts.models import Follow
+from .models import Post, TimelineEntry
+
+
+# Number of rows written per INSERT when fanning out or backfilling
+BATCH_SIZE = 1000
+
+# How many of an account's most recent posts land in a new follower's timeline
+BACKFILL_LIMIT = 200
+
+
+def _write_entries(entries):
+    TimelineEntry.objects.bulk_create(entries, batch_size=BATCH_SIZE, ignore_conflicts=True)
+
+
+def fan_out_post(post):
+    """Push a newly created post into the timelines of the author's followers"""
+    follower_ids = Follow.objects.follower_user_ids(post.author_id)
+
+    batch = []
+    for user_id in follower_ids.iterator(chunk_size=BATCH_SIZE):
+        batch.append(TimelineEntry(
+            user_id=user_id,
+            post_id=post.id,
+            author_id=post.author_id,
+            created_at=post.created_at,
+        ))
+        if len(batch) >= BATCH_SIZE:
+            _write_entries(batch)
+            batch = []
+    if batch:
+        _write_entries(batch)
+
+
+def backfill(user, author, limit=BACKFILL_LIMIT):
+    """Copy the author's most recent posts into the user's timeline after a follow"""
+    posts = Post.objects.filter(author=author).order_by('-created_at').values_list('id', 'created_at')[:limit]
+    _write_entries([
+        TimelineEntry(user_id=user.id, post_id=post_id, author_id=author.id, created_at=created_at)
+        for post_id, created_at in posts
+    ])
+
+
+def prune(user, author):
+    """Remove the author's posts from the user's timeline after an unfollow"""
+    TimelineEntry.objects.filter(user=user, author=author).delete()
+
+
+class TimelinePagination(KeysetPagination):
+    """Pages a home timeline along its (user, created_at, post) index"""
+    ordering = ('-created_at', '-post_id')
+
+
+def home_timeline(user):
+    """Timeline entries for the user, newest first"""
+    return TimelineEntry.objects.filter(user=user).order_by('-created_at', '-post_id')
+
+
+def posts_for_entries(entries, queryset=None):
+    """Load the posts behind a page of entries (anything with a post_id), keeping their order"""
+    if queryset is None:
+        queryset = Post.objects.select_related('author', 'author__profile')
+    post_ids = [entry.post_id for entry in entries]
+    posts = queryset.in_bulk(post_ids)
+    return [posts[post_id] for post_id in post_ids if post_id in posts]
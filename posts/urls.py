@@ -14,7 +14,12 @@ urlpatterns = [
     path('feed/', views.feed_view, name='feed'),
     path('explore/', views.explore_view, name='explore'),
     
+    # Hashtags (trending lives outside tags/ so it cannot shadow a #trending tag)
+    path('trending-tags/', views.trending_tags, name='trending-tags'),
+    path('tags/<str:tag>/', views.tag_posts, name='tag-posts'),
+    
     # Stories
     path('stories/', views.StoryListCreateView.as_view(), name='story-list-create'),
+    path('stories/tray/', views.story_tray, name='story-tray'),
     path('stories/<int:pk>/', views.StoryDetailView.as_view(), name='story-detail'),
 ]
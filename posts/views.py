@@ -3,11 +3,17 @@ from rest_framework.decorators import api_view, permission_classes
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
 from django.shortcuts import get_object_or_404
-from django.utils import timezone
-from django.db.models import Q
-from .models import Post, Comment, Story, StoryView, SavedPost
+from django.db import transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+from accounts.models import Profile
+from accounts.notifications import notify
+from core.background import defer
+from core.pagination import KeysetPagination, OldestFirstPagination
+from .models import Post, Comment, Story, SavedPost
+from . import explore, media, stories, story_views, tags, timeline
 from .serializers import (
-    PostSerializer, PostCreateSerializer, CommentSerializer,
+    PostSummarySerializer, PostCreateSerializer, CommentSerializer,
     StorySerializer, StoryViewSerializer
 )
 
@@ -19,22 +25,29 @@ class PostListCreateView(generics.ListCreateAPIView):
     def get_serializer_class(self):
         if self.request.method == 'POST':
             return PostCreateSerializer
-        return PostSerializer
+        return PostSummarySerializer
     
     def get_queryset(self):
-        return Post.objects.select_related('author').prefetch_related('likes', 'comments')
+        return PostSummarySerializer.setup_eager_loading(Post.objects.all())
     
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        post = serializer.save(author=self.request.user)
+        Profile.objects.filter(user=self.request.user).update(posts_count=F('posts_count') + 1)
+        defer(timeline.fan_out_post, post)
+        explore.refresh_post(post.id)
+        tags.index_post(post)
+        tags.record_mentions(post, self.request.user, post.caption)
+        media.queue(post)
 
 
 class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
     """Get post details, update caption, and delete post (owner only)"""
-    serializer_class = PostSerializer
+    serializer_class = PostSummarySerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
     
     def get_queryset(self):
-        return Post.objects.select_related('author').prefetch_related('likes', 'comments', 'comments__author')
+        # Comments beyond the preview come from the comments endpoint
+        return PostSummarySerializer.setup_eager_loading(Post.objects.all())
     
     def get_serializer_context(self):
         context = super().get_serializer_context()
@@ -52,6 +65,8 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
         if 'caption' in request.data:
             post.caption = request.data['caption']
             post.save()
+            tags.index_post(post)
+            tags.record_mentions(post, request.user, post.caption)
             serializer = self.get_serializer(post)
             return Response(serializer.data)
         return Response({'error': 'No caption provided'}, status=status.HTTP_400_BAD_REQUEST)
@@ -63,7 +78,12 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
                 {'error': 'You can only delete your own posts'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        return super().delete(request, *args, **kwargs)
+        tags.unindex_post(post)
+        files = media.stored_names(post.image.name, post.video.name, post.media_variants)
+        response = super().delete(request, *args, **kwargs)
+        Profile.objects.filter(user=request.user).update(posts_count=F('posts_count') - 1)
+        transaction.on_commit(lambda: media.remove_files(files))
+        return response
 
 
 @api_view(['POST'])
@@ -71,13 +91,23 @@ class PostDetailView(generics.RetrieveUpdateDestroyAPIView):
 def toggle_like(request, pk):
     """Toggle like on a post"""
     post = get_object_or_404(Post, pk=pk)
+    posts = Post.objects.filter(pk=post.pk)
+    likes = Post.likes.through.objects
     
-    if request.user in post.likes.all():
-        post.likes.remove(request.user)
+    # The counter moves by the rows actually deleted or created, so
+    # concurrent toggles from the same user cannot count twice
+    unliked, _ = likes.filter(post_id=post.pk, user_id=request.user.pk).delete()
+    if unliked:
+        posts.update(likes_count=Greatest(F('likes_count') - unliked, 0))
+        explore.refresh_post(post.id)
         return Response({'status': 'unliked'}, status=status.HTTP_200_OK)
-    else:
-        post.likes.add(request.user)
-        return Response({'status': 'liked'}, status=status.HTTP_200_OK)
+    
+    _, liked = likes.get_or_create(post_id=post.pk, user_id=request.user.pk)
+    if liked:
+        posts.update(likes_count=F('likes_count') + 1)
+        explore.refresh_post(post.id)
+        notify(post.author_id, request.user.id, 'like', 'post', post.id)
+    return Response({'status': 'liked'}, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
@@ -85,73 +115,88 @@ def toggle_like(request, pk):
 def toggle_save(request, pk):
     """Toggle save on a post"""
     post = get_object_or_404(Post, pk=pk)
+    posts = Post.objects.filter(pk=post.pk)
     
-    # Check if already saved
-    saved = SavedPost.objects.filter(user=request.user, post=post).first()
+    unsaved, _ = SavedPost.objects.filter(user=request.user, post=post).delete()
+    if unsaved:
+        posts.update(saves_count=Greatest(F('saves_count') - unsaved, 0))
+        explore.refresh_post(post.id)
+        return Response({'status': 'unsaved'}, status=status.HTTP_200_OK)
     
+    _, saved = SavedPost.objects.get_or_create(user=request.user, post=post)
     if saved:
-        saved.delete()
-        return Response({'status': 'unsaved'}, status=status.HTTP_200_OK)
-    else:
-        SavedPost.objects.create(user=request.user, post=post)
-        return Response({'status': 'saved'}, status=status.HTTP_200_OK)
+        posts.update(saves_count=F('saves_count') + 1)
+        explore.refresh_post(post.id)
+    return Response({'status': 'saved'}, status=status.HTTP_200_OK)
 
 
 class CommentListCreateView(generics.ListCreateAPIView):
     """List comments for a post and create new comments"""
     serializer_class = CommentSerializer
     permission_classes = [IsAuthenticatedOrReadOnly]
+    pagination_class = OldestFirstPagination
     
     def get_queryset(self):
         post_id = self.kwargs.get('post_id')
-        return Comment.objects.filter(post_id=post_id)
+        return Comment.objects.filter(post_id=post_id).select_related('author', 'author__profile')
     
     def perform_create(self, serializer):
         post_id = self.kwargs.get('post_id')
         post = get_object_or_404(Post, id=post_id)
-        serializer.save(author=self.request.user, post=post)
+        comment = serializer.save(author=self.request.user, post=post)
+        Post.objects.filter(pk=post.pk).update(comments_count=F('comments_count') + 1)
+        explore.refresh_post(post.id)
+        tags.record_mentions(post, self.request.user, comment.text, comment=comment)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticated])
 def feed_view(request):
     """Get feed with posts from followed users"""
-    user = request.user
-    following_profiles = user.profile.following.all()
-    following_users = [profile.user for profile in following_profiles]
-    
-    # Get posts from followed users
-    posts = Post.objects.filter(
-        author__in=following_users
-    ).select_related('author').prefetch_related('likes', 'comments').order_by('-created_at')
-    
-    # Paginate manually or use DRF pagination
-    page = int(request.GET.get('page', 1))
-    page_size = 10
-    start = (page - 1) * page_size
-    end = start + page_size
-    
-    paginated_posts = posts[start:end]
-    serializer = PostSerializer(
-        paginated_posts,
-        many=True,
-        context={'request': request}
-    )
+    paginator = timeline.TimelinePagination()
+    entries = paginator.paginate_queryset(timeline.home_timeline(request.user), request)
     
-    return Response({
-        'results': serializer.data,
-        'count': posts.count(),
-        'page': page
-    })
+    posts = timeline.posts_for_entries(
+        entries,
+        PostSummarySerializer.setup_eager_loading(Post.objects.all())
+    )
+    serializer = PostSummarySerializer(posts, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
 
 
 @api_view(['GET'])
 @permission_classes([IsAuthenticatedOrReadOnly])
 def explore_view(request):
-    """Get random/recommended posts for explore page"""
-    posts = Post.objects.select_related('author').prefetch_related('likes', 'comments', 'comments__author').order_by('-created_at')[:20]
-    serializer = PostSerializer(posts, many=True, context={'request': request})
-    return Response(serializer.data)
+    """Get ranked posts for explore page from the precomputed candidate pool"""
+    paginator = explore.ExplorePagination()
+    candidates = paginator.paginate_queryset(explore.candidates_for(request.user), request)
+    posts = timeline.posts_for_entries(
+        candidates,
+        PostSummarySerializer.setup_eager_loading(Post.objects.all())
+    )
+    serializer = PostSummarySerializer(posts, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def tag_posts(request, tag):
+    """Get posts for a hashtag, newest first"""
+    paginator = tags.TagPagination()
+    entries = paginator.paginate_queryset(tags.posts_for_tag(tag), request)
+    posts = timeline.posts_for_entries(
+        entries,
+        PostSummarySerializer.setup_eager_loading(Post.objects.all())
+    )
+    serializer = PostSummarySerializer(posts, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticatedOrReadOnly])
+def trending_tags(request):
+    """Get the most used hashtags of the last day"""
+    return Response(tags.trending())
 
 
 class StoryListCreateView(generics.ListCreateAPIView):
@@ -160,24 +205,17 @@ class StoryListCreateView(generics.ListCreateAPIView):
     permission_classes = [IsAuthenticated]
     
     def get_queryset(self):
-        # Get active stories from user, following, and followers
+        # Active stories from the user, following, and followers, with seen
+        # state resolved in the same query
         user = self.request.user
+        queryset = stories.with_viewer_state(stories.active_stories(user), user)
         
-        # Get users you follow
-        following_profiles = user.profile.following.all()
-        following_users = [profile.user for profile in following_profiles]
-        
-        # Get users who follow you
-        follower_profiles = user.profile.followers.all()
-        follower_users = [profile.user for profile in follower_profiles]
+        # ?user=<id> narrows the list to one author's ring from the tray
+        author_id = self.request.query_params.get('user')
+        if author_id and author_id.isdigit():
+            queryset = queryset.filter(user_id=author_id)
         
-        # Combine both lists
-        all_users = set(following_users + follower_users + [user])
-        
-        return Story.objects.filter(
-            user__in=all_users,
-            expires_at__gt=timezone.now()
-        ).select_related('user', 'user__profile').order_by('-created_at')
+        return queryset.select_related('user', 'user__profile').order_by('-created_at')
     
     def get_serializer_context(self):
         """Pass request context to serializer"""
@@ -186,7 +224,15 @@ class StoryListCreateView(generics.ListCreateAPIView):
         return context
     
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        story = serializer.save(user=self.request.user)
+        media.queue(story)
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def story_tray(request):
+    """One entry per author with active stories, for the home page tray"""
+    return Response(stories.tray(request.user))
 
 
 class StoryDetailView(generics.RetrieveDestroyAPIView):
@@ -198,12 +244,10 @@ class StoryDetailView(generics.RetrieveDestroyAPIView):
     def retrieve(self, request, *args, **kwargs):
         story = self.get_object()
         
-        # Mark as viewed if not owner
+        # Mark as viewed if not owner (buffered, written in batches)
         if story.user != request.user:
-            StoryView.objects.get_or_create(
-                story=story,
-                viewer=request.user
-            )
+            story_views.record(story.id, request.user.id)
+            story.viewed = True
         
         serializer = self.get_serializer(story)
         return Response(serializer.data)
@@ -215,7 +259,13 @@ class StoryDetailView(generics.RetrieveDestroyAPIView):
                 {'error': 'You can only delete your own stories'},
                 status=status.HTTP_403_FORBIDDEN
             )
-        return super().delete(request, *args, **kwargs)
+        # Removes the story's media files too, not just the row
+        stories.delete_stories([story.id])
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+
+class ProfileGridPagination(KeysetPagination):
+    page_size = 24
 
 
 @api_view(['GET'])
@@ -224,6 +274,10 @@ def user_posts(request, username):
     """Get all posts for a specific user"""
     from django.contrib.auth.models import User
     user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user).order_by('-created_at')
-    serializer = PostSerializer(posts, many=True, context={'request': request})
-    return Response(serializer.data)
+    paginator = ProfileGridPagination()
+    posts = paginator.paginate_queryset(
+        PostSummarySerializer.setup_eager_loading(Post.objects.filter(author=user)),
+        request
+    )
+    serializer = PostSummarySerializer(posts, many=True, context={'request': request})
+    return paginator.get_paginated_response(serializer.data)
@@ -96,11 +96,62 @@ WSGI_APPLICATION = 'socialapp.wsgi.application'
 ASGI_APPLICATION = 'socialapp.asgi.application'
 
 # Channels configuration
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# CHANNEL_REDIS_URLS is a comma-separated list of redis:// URLs. With more
+# than one, channels_redis shards channels and group membership across them
+# by consistent hashing. Without it the in-memory layer is used, which only
+# delivers within a single process. Check a deployment with
+# `python manage.py check_channel_layer`.
+CHANNEL_REDIS_URLS = [url.strip() for url in os.getenv('CHANNEL_REDIS_URLS', '').split(',') if url.strip()]
+
+if CHANNEL_REDIS_URLS:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': CHANNEL_REDIS_URLS,
+                'prefix': os.getenv('CHANNEL_PREFIX', 'asgi'),
+                'capacity': int(os.getenv('CHANNEL_CAPACITY', '1500')),
+                'expiry': int(os.getenv('CHANNEL_EXPIRY', '60')),
+                'group_expiry': int(os.getenv('CHANNEL_GROUP_EXPIRY', '86400')),
+            },
+        }
     }
-}
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
+    }
+
+# Cache
+# Conversation membership, unread badges and typing state are cached and
+# invalidated on change, so every worker has to share one cache.
+# CACHE_REDIS_URL defaults to the first channel layer host; without either,
+# the per-process local memory cache is only safe with a single process.
+CACHE_REDIS_URL = os.getenv('CACHE_REDIS_URL', CHANNEL_REDIS_URLS[0] if CHANNEL_REDIS_URLS else '')
+
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': os.getenv('CACHE_PREFIX', 'socialapp'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+
+# Background work runs on in-process thread pools after the request's
+# transaction commits: quick jobs (notification writes, story view flushes)
+# on the default pool, media processing on its own so it cannot starve them
+BACKGROUND_WORKERS = int(os.getenv('BACKGROUND_WORKERS', '4'))
+BACKGROUND_MEDIA_WORKERS = int(os.getenv('BACKGROUND_MEDIA_WORKERS', '1'))
+BACKGROUND_TASKS_EAGER = os.getenv('BACKGROUND_TASKS_EAGER', '') == '1'
 
 
 # Database
@@ -2,6 +2,7 @@ from django.contrib import admin
 from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
+from core.views import rendition
 from accounts.template_views import (
     index_view, login_view, register_view, profile_view, explore_view,
     messages_view, notifications_view, post_detail_view, reset_password_view,
@@ -15,6 +16,9 @@ urlpatterns = [
     path('api/', include('accounts.urls')),
     path('api/', include('posts.urls')),
     
+    # Resized images, generated on first request and cached
+    path('renditions/<str:rendition>/<str:token>/<path:name>', rendition, name='rendition'),
+    
     # Custom social signup redirect (must be before allauth.urls)
     path('accounts/3rdparty/signup/', social_signup_redirect, name='social-signup-redirect'),
     